@@ -0,0 +1,124 @@
+import asyncio
+import math
+from collections import deque
+
+# Reasons a request is shed, as reported in metrics
+SHED_REASONS = ("queue_full", "queue_timeout", "deadline")
+
+# Weight of the latest request in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class Shed(Exception):
+    """A request turned away by admission control"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue and deadline-aware shedding
+
+    Up to max_concurrency requests run at once and up to max_queue more
+    wait for a slot. Anything beyond that is shed straight away, and a
+    queued request is shed once it has waited max_wait_seconds or once its
+    deadline leaves less time than a typical request takes.
+    """
+
+    def __init__(self, max_concurrency, max_queue, max_wait_seconds=0.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.admitted = 0
+        self.shed = dict.fromkeys(SHED_REASONS, 0)
+        self.service_seconds = 0.0
+        self._waiters = deque()
+
+    def retry_after(self):
+        """Whole seconds until the current backlog should have drained"""
+        backlog = self.active + len(self._waiters)
+        return max(1, math.ceil(backlog * self.service_seconds / self.max_concurrency))
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        return Shed(reason, self.retry_after())
+
+    async def acquire(self, deadline=None):
+        """Wait for a slot; deadline is a loop.time() value the response is due by
+
+        Raises Shed when the request should be turned away.
+        """
+        loop = asyncio.get_running_loop()
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+
+        timeout, reason = None, "queue_timeout"
+        if self.max_wait_seconds:
+            timeout = self.max_wait_seconds
+        if deadline is not None:
+            # Leave the request enough time to be served once it gets a slot
+            budget = deadline - loop.time() - self.service_seconds
+            if timeout is None or budget < timeout:
+                timeout, reason = budget, "deadline"
+        if timeout is not None and timeout <= 0:
+            raise self._shed(reason)
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+            else:
+                self._remove(waiter)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._shed(reason) from None
+
+        if deadline is not None and loop.time() + self.service_seconds > deadline:
+            self.release()
+            raise self._shed("deadline")
+        self.admitted += 1
+
+    def _remove(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, service_seconds=None):
+        """Free a slot, handing it to the oldest waiter if there is one"""
+        if service_seconds is not None:
+            if self.service_seconds:
+                self.service_seconds += SERVICE_TIME_SMOOTHING * (service_seconds - self.service_seconds)
+            else:
+                self.service_seconds = service_seconds
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "service_seconds": self.service_seconds,
+        }
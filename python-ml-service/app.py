@@ -1,359 +1,464 @@
-from fastapi import FastAPI, File, UploadFile, Form
+import time
+
+# Start of the module import, for the cold-start timings
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import binascii
+import importlib
+import logging
+import math
+from typing import List
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 import random
-import io
-from PIL import Image
 import base64
-import numpy as np
+
+import config
+from admission import AdmissionController, Shed
+from batching import MicroBatcher
+from cache import create_result_cache, decision_namespace, make_cache_key
+from dedup import NearDuplicateIndex, fingerprint_images
+from jobs import Job, create_job_store, new_job_id
+from ingest import RequestBodyLimit, UploadRejected, iter_bytes, iter_upload_file, read_image_stream
+from catalog import (
+    DISEASE_DATABASE,
+    DEFAULT_CATALOG_KEY,
+    MODEL_VERSION,
+    catalog_documents,
+    loads,
+    normalize_crop,
+    render_fallback,
+    render_prediction,
+    utc_timestamp,
+)
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    Counter,
+    GaugeCallback,
+    Histogram,
+    Registry,
+    add_fallback,
+    add_stage,
+    merge_profile,
+    new_profile,
+    server_timing_header,
+)
+from precompressed import PrecompressedBody
+from workers import PoolUnavailable, create_executor, run_in_executor
+
+logger = logging.getLogger("cropcare.ml")
 
 app = FastAPI(title="CropCare ML Service", version="2.0.0")
 
+# Upper bound on images accepted by a single /predict/batch call
+MAX_BATCH_SIZE = 64
+
+# Pool running the CPU-bound analysis, created by the warm-up task after startup
+analysis_executor = None
+
+# Set once the first attempt to start analysis_executor has finished, successfully or not
+executor_attempted = None
+
+# Whether analysis_executor is up; otherwise the error of the last attempt and
+# the loop time of the next one, while pool creation is retried
+executor_started = False
+executor_error = None
+executor_retry_at = None
+
+# Delay before retrying a failed pool start, doubling up to the maximum
+EXECUTOR_RETRY_SECONDS = 1.0
+EXECUTOR_RETRY_MAX_SECONDS = 30.0
+
+# Background start-up work; the service reports ready once it has finished
+warm_up_task = None
+service_ready = False
+
+# Seconds from the start of the module import to each start-up milestone
+STARTUP_SECONDS = {}
+
+# Decisions for previously seen uploads, keyed by image content and crop
+result_cache = None
+
+# Model version and rule table digest that cache keys are scoped to, set on startup
+cache_namespace = ""
+
+# result_cache.stats() as read at the start of the current /metrics scrape
+cache_snapshot = None
+
+# Encoded /catalog bodies keyed by crop (None for the whole catalog), built on startup
+catalog_bodies = None
+
+# Decisions for near-duplicate photos, keyed by perceptual hash; None unless enabled
+near_duplicates = None
+
+# Coalesces concurrent single-image requests into batched analysis calls
+micro_batcher = None
+
+# Asynchronous jobs: their store, the tasks still queued or running, and
+# events that wake long-polling readers when a job finishes
+job_store = None
+job_slots = None
+job_tasks = {}
+job_events = {}
+job_sweeper = None
+
+# How often a long-poll re-reads the store, for jobs run by another worker process
+JOB_POLL_INTERVAL_SECONDS = 0.5
+
+# Limits concurrent prediction requests and sheds the excess; None when disabled
+admission = None
+
+# Request header with the milliseconds the caller will wait for a response
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+# Request header that asks for the per-stage breakdown in a Server-Timing header
+PROFILE_HEADER = "x-profile"
+
+# Allowance for multipart boundaries and form fields on top of the image bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+METRICS = Registry()
+REQUEST_STAGE_SECONDS = METRICS.register(Histogram(
+    "ml_request_stage_seconds",
+    "Time spent per request in each stage of the prediction handlers",
+    ["endpoint", "stage"],
+))
+ANALYSIS_STAGE_SECONDS = METRICS.register(Histogram(
+    "ml_analysis_stage_seconds",
+    "Time spent per analysis call in each stage on the worker pool",
+    ["stage"],
+))
+PREDICTIONS = METRICS.register(Counter(
+    "ml_predictions_total",
+    "Diagnoses returned, by crop and detected disease",
+    ["crop", "disease"],
+))
+FALLBACKS = METRICS.register(Counter(
+    "ml_fallbacks_total",
+    "Predictions that went through an error or fallback path",
+    ["path"],
+))
+CATALOG_RESPONSES = METRICS.register(Counter(
+    "ml_catalog_responses_total",
+    "Catalog responses, by content coding or not_modified for a 304",
+    ["coding"],
+))
+REJECTED_UPLOADS = METRICS.register(Counter(
+    "ml_rejected_uploads_total",
+    "Uploads refused before decoding, by reason",
+    ["reason"],
+))
+METRICS.register(GaugeCallback(
+    "ml_catalog_body_bytes",
+    "Size of each precompressed catalog body, by catalog (crop, or all) and content coding",
+    lambda: [({"catalog": key or "all", "coding": coding}, size)
+             for key, body in catalog_bodies.items()
+             for coding, size in body.stats().items()] if catalog_bodies is not None else [],
+    ["catalog", "coding"],
+))
+METRICS.register(GaugeCallback(
+    "ml_cache_events_total",
+    "Result cache hits, misses, evictions and expirations",
+    lambda: [({"event": event}, cache_snapshot[event])
+             for event in ("hits", "misses", "evictions", "expirations")] if cache_snapshot is not None else [],
+    ["event"],
+    kind="counter",
+))
+METRICS.register(GaugeCallback(
+    "ml_cache_bytes",
+    "Approximate size of the result cache",
+    lambda: [({}, cache_snapshot["bytes"])] if cache_snapshot is not None else [],
+))
+METRICS.register(GaugeCallback(
+    "ml_near_duplicate_events_total",
+    "Perceptual-hash index lookups that reused a stored decision (hits) or not (misses)",
+    lambda: [({"event": event}, near_duplicates.stats()[event])
+             for event in ("hits", "misses", "evictions")] if near_duplicates is not None else [],
+    ["event"],
+    kind="counter",
+))
+METRICS.register(GaugeCallback(
+    "ml_near_duplicate_entries",
+    "Fingerprints held by the perceptual-hash index",
+    lambda: [({}, near_duplicates.stats()["entries"])] if near_duplicates is not None else [],
+))
+METRICS.register(GaugeCallback(
+    "ml_startup_seconds",
+    "Seconds from the start of the module import to each start-up milestone",
+    lambda: [({"phase": phase}, seconds) for phase, seconds in STARTUP_SECONDS.items()],
+    ["phase"],
+))
+METRICS.register(GaugeCallback(
+    "ml_admission_active_requests",
+    "Prediction requests holding an admission slot",
+    lambda: [({}, admission.active)] if admission is not None else [],
+))
+METRICS.register(GaugeCallback(
+    "ml_admission_queue_depth",
+    "Prediction requests waiting for an admission slot",
+    lambda: [({}, admission.stats()["queue_depth"])] if admission is not None else [],
+))
+METRICS.register(GaugeCallback(
+    "ml_admission_shed_total",
+    "Prediction requests answered with 503, by reason",
+    lambda: [({"reason": reason}, count) for reason, count in admission.shed.items()] if admission is not None else [],
+    ["reason"],
+    kind="counter",
+))
+METRICS.register(GaugeCallback(
+    "ml_batcher_queue_depth",
+    "Single-image requests waiting for a micro-batch",
+    lambda: [({}, micro_batcher.stats()["queue_depth"])] if micro_batcher is not None else [],
+))
+METRICS.register(GaugeCallback(
+    "ml_batcher_batches_total",
+    "Micro-batches sent to the analysis backend",
+    lambda: [({}, micro_batcher.batches)] if micro_batcher is not None else [],
+    kind="counter",
+))
+METRICS.register(GaugeCallback(
+    "ml_batcher_items_total",
+    "Images sent to the analysis backend through micro-batches",
+    lambda: [({}, micro_batcher.items)] if micro_batcher is not None else [],
+    kind="counter",
+))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-# Comprehensive disease database with accurate treatments
-DISEASE_DATABASE = {
-    "tomato": [
-        {
-            "name": "Late Blight",
-            "confidence": 0.92,
-            "severity": "High",
-            "description": "A serious fungal disease caused by Phytophthora infestans, affecting tomato plants with dark spots on leaves and fruit.",
-            "symptoms": ["Dark water-soaked spots on leaves", "Brown patches on stems", "White fuzzy growth on leaf undersides", "Fruit rot with dark lesions"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Copper Fungicide (Organic)",
-                        "dosage": "2-3g per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 85,
-                        "instructions": "Apply in early morning or evening. Ensure complete coverage of leaves and stems."
-                    },
-                    {
-                        "name": "Baking Soda + Soap Solution",
-                        "dosage": "1 tbsp baking soda + 1L water + few drops dish soap",
-                        "frequency": "Every 5-7 days",
-                        "effectiveness": 70,
-                        "instructions": "Spray on affected areas. Test on small area first to avoid leaf burn."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Mancozeb 75% WP",
-                        "dosage": "2.5g per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 95,
-                        "warning": "Use protective gear. Wait 7 days before harvest. Avoid spraying near water sources.",
-                        "instructions": "Apply preventively before disease onset for best results. Rotate with other fungicides."
-                    },
-                    {
-                        "name": "Chlorothalonil",
-                        "dosage": "2g per liter of water",
-                        "frequency": "Every 7-14 days",
-                        "effectiveness": 90,
-                        "warning": "Toxic to aquatic life. Use protective equipment.",
-                        "instructions": "Apply as preventive measure. Do not exceed 4 applications per season."
-                    }
-                ]
-            },
-            "prevention": ["Proper plant spacing for air circulation", "Avoid overhead watering", "Remove infected plant debris", "Use resistant varieties"]
-        },
-        {
-            "name": "Early Blight",
-            "confidence": 0.88,
-            "severity": "Medium",
-            "description": "Fungal disease caused by Alternaria solani, creating concentric ring spots on leaves.",
-            "symptoms": ["Concentric ring spots on leaves", "Yellowing of lower leaves", "Dark lesions on stems", "Fruit spots with dark centers"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Neem Oil Spray",
-                        "dosage": "5ml per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 75,
-                        "instructions": "Apply in evening to avoid leaf burn. Mix with mild soap for better adherence."
-                    },
-                    {
-                        "name": "Copper Sulfate",
-                        "dosage": "1g per liter of water",
-                        "frequency": "Every 10-14 days",
-                        "effectiveness": 80,
-                        "instructions": "Use sparingly to avoid copper buildup in soil."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Azoxystrobin",
-                        "dosage": "1ml per liter of water",
-                        "frequency": "Every 14 days",
-                        "effectiveness": 90,
-                        "warning": "Follow resistance management guidelines. Do not exceed recommended dose.",
-                        "instructions": "Most effective when applied preventively. Alternate with other fungicide groups."
-                    }
-                ]
-            },
-            "prevention": ["Crop rotation", "Mulching to prevent soil splash", "Proper fertilization", "Remove infected leaves promptly"]
-        },
-        {
-            "name": "Bacterial Spot",
-            "confidence": 0.85,
-            "severity": "Medium",
-            "description": "Bacterial disease causing small dark spots on leaves and fruit.",
-            "symptoms": ["Small dark spots with yellow halos", "Leaf yellowing and drop", "Fruit spots with raised centers", "Stem cankers"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Copper Hydroxide",
-                        "dosage": "2g per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 70,
-                        "instructions": "Apply preventively. Copper can cause phytotoxicity in high concentrations."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Streptomycin Sulfate",
-                        "dosage": "200ppm solution",
-                        "frequency": "Every 5-7 days",
-                        "effectiveness": 85,
-                        "warning": "Antibiotic resistance can develop. Use only when necessary.",
-                        "instructions": "Apply during cool, humid conditions for best results."
-                    }
-                ]
-            },
-            "prevention": ["Use pathogen-free seeds", "Avoid overhead irrigation", "Sanitize tools", "Remove infected plant debris"]
-        }
-    ],
-    "wheat": [
-        {
-            "name": "Wheat Rust",
-            "confidence": 0.90,
-            "severity": "High",
-            "description": "Fungal disease causing orange-red pustules on wheat leaves and stems.",
-            "symptoms": ["Orange-red pustules on leaves", "Yellow streaks on leaves", "Premature leaf death", "Reduced grain quality"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Sulfur Dust",
-                        "dosage": "20-30g per square meter",
-                        "frequency": "Every 10-14 days",
-                        "effectiveness": 70,
-                        "instructions": "Apply during calm weather. Avoid application during hot sunny days."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Propiconazole",
-                        "dosage": "1ml per liter of water",
-                        "frequency": "Every 14-21 days",
-                        "effectiveness": 95,
-                        "warning": "Follow pre-harvest interval. Use protective equipment.",
-                        "instructions": "Apply at first sign of disease. Most effective during early infection stages."
-                    }
-                ]
-            },
-            "prevention": ["Use resistant varieties", "Proper crop rotation", "Remove volunteer wheat plants", "Monitor weather conditions"]
-        }
-    ],
-    "corn": [
-        {
-            "name": "Corn Leaf Blight",
-            "confidence": 0.87,
-            "severity": "Medium",
-            "description": "Fungal disease causing elongated lesions on corn leaves.",
-            "symptoms": ["Long, elliptical lesions on leaves", "Gray-green to tan colored spots", "Lesions with dark borders", "Premature leaf death"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Bacillus subtilis",
-                        "dosage": "2-3g per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 75,
-                        "instructions": "Apply during cooler parts of the day. Biological control agent."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Azoxystrobin + Propiconazole",
-                        "dosage": "1.5ml per liter of water",
-                        "frequency": "Every 14-21 days",
-                        "effectiveness": 90,
-                        "warning": "Follow resistance management practices.",
-                        "instructions": "Apply at early reproductive stages for maximum benefit."
-                    }
-                ]
-            },
-            "prevention": ["Crop rotation with non-host crops", "Use resistant hybrids", "Manage crop residue", "Balanced fertilization"]
-        }
-    ],
-    "potato": [
-        {
-            "name": "Late Blight",
-            "confidence": 0.91,
-            "severity": "High",
-            "description": "Devastating disease caused by Phytophthora infestans affecting potato plants.",
-            "symptoms": ["Dark water-soaked lesions on leaves", "White fungal growth on leaf undersides", "Blackened stems", "Tuber rot"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Copper Fungicide",
-                        "dosage": "2-3g per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 80,
-                        "instructions": "Apply preventively during favorable weather conditions."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Metalaxyl + Mancozeb",
-                        "dosage": "2.5g per liter of water",
-                        "frequency": "Every 7-14 days",
-                        "effectiveness": 95,
-                        "warning": "Follow pre-harvest intervals. Use protective gear.",
-                        "instructions": "Apply before disease establishment for best results."
-                    }
-                ]
-            },
-            "prevention": ["Use certified seed potatoes", "Proper hill drainage", "Avoid overhead irrigation", "Destroy infected plants"]
-        }
-    ],
-    "rice": [
-        {
-            "name": "Blast Disease",
-            "confidence": 0.89,
-            "severity": "High",
-            "description": "Fungal disease causing diamond-shaped lesions on rice leaves.",
-            "symptoms": ["Diamond-shaped lesions with gray centers", "Brown borders around lesions", "Neck rot in severe cases", "Reduced grain filling"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Silicon Fertilizer",
-                        "dosage": "2kg per hectare",
-                        "frequency": "Once per season",
-                        "effectiveness": 70,
-                        "instructions": "Apply during tillering stage to strengthen plant cell walls."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Tricyclazole",
-                        "dosage": "0.6g per liter of water",
-                        "frequency": "Every 15-20 days",
-                        "effectiveness": 90,
-                        "warning": "Do not apply during flowering stage.",
-                        "instructions": "Apply at tillering and panicle initiation stages."
-                    }
-                ]
-            },
-            "prevention": ["Use resistant varieties", "Balanced nitrogen fertilization", "Proper water management", "Remove infected stubble"]
-        }
-    ]
-}
-
-# Default fallback for unknown crops
-DEFAULT_DISEASES = [
-    {
-        "name": "General Plant Disease",
-        "confidence": 0.75,
-        "severity": "Medium",
-        "description": "A common plant disease has been detected. Further analysis recommended.",
-        "symptoms": ["Abnormal leaf coloration", "Spots or lesions on plant parts", "Reduced plant vigor"],
-        "treatment": {
-            "organic": [
-                {
-                    "name": "Neem Oil Treatment",
-                    "dosage": "5ml per liter of water",
-                    "frequency": "Every 7 days",
-                    "effectiveness": 70,
-                    "instructions": "General purpose organic treatment. Apply during cooler parts of the day."
-                }
-            ],
-            "chemical": [
-                {
-                    "name": "Broad Spectrum Fungicide",
-                    "dosage": "As per label instructions",
-                    "frequency": "Every 10-14 days",
-                    "effectiveness": 80,
-                    "warning": "Follow all safety precautions and label instructions.",
-                    "instructions": "Consult local agricultural expert for specific recommendations."
-                }
-            ]
-        },
-        "prevention": ["Regular monitoring", "Proper sanitation", "Adequate spacing", "Balanced nutrition"]
-    }
-]
+def request_byte_limit(path):
+    """Largest request body accepted on a prediction path, or None for other paths"""
+    if path in ("/predict/batch", "/jobs"):
+        return config.MAX_UPLOAD_BYTES * MAX_BATCH_SIZE + MULTIPART_OVERHEAD_BYTES
+    if path == "/predict/base64":
+        # base64 inflates the image by 4/3
+        return config.MAX_UPLOAD_BYTES * 4 // 3 + MULTIPART_OVERHEAD_BYTES
+    if path.startswith("/predict"):
+        return config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    return None
+
+def configured_byte_limit(path):
+    return config.MAX_UPLOAD_BYTES and request_byte_limit(path)
 
-def analyze_image_for_disease(image_data, crop_type):
-    """Advanced disease detection based on image analysis"""
+# Outermost, so bodies are counted before any middleware or form parser reads them
+app.add_middleware(RequestBodyLimit, limit_for_path=configured_byte_limit)
+
+def request_deadline(request):
+    """loop.time() by which the caller gives up, from the deadline header, or None"""
+    timeout_ms = request.headers.get(DEADLINE_HEADER, "")
     try:
-        image = Image.open(io.BytesIO(image_data))
-        img_array = np.array(image)
-        
-        if len(img_array.shape) != 3:
-            return "Healthy Plant", 0.85
-        
-        # Color analysis
-        red_channel = img_array[:, :, 0]
-        green_channel = img_array[:, :, 1]
-        blue_channel = img_array[:, :, 2]
-        
-        red_mean = np.mean(red_channel)
-        green_mean = np.mean(green_channel)
-        blue_mean = np.mean(blue_channel)
-        
-        # Disease indicators
-        brown_spots = red_mean > green_mean and red_mean > 120
-        yellow_patches = red_mean > 150 and green_mean > 150 and blue_mean < 100
-        dark_lesions = red_mean < 80 and green_mean < 80 and blue_mean < 80
-        white_growth = red_mean > 200 and green_mean > 200 and blue_mean > 200
-        
-        # Texture analysis (simplified)
-        green_std = np.std(green_channel)
-        texture_variation = green_std > 60  # High variation indicates disease
-        
-        # Disease detection logic
-        if crop_type.lower() == "potato":
-            if dark_lesions and texture_variation:
-                return "Late Blight", 0.92
-            elif brown_spots:
-                return "Early Blight", 0.88
-            elif white_growth:
-                return "Powdery Mildew", 0.85
-        elif crop_type.lower() == "tomato":
-            if dark_lesions and texture_variation:
-                return "Late Blight", 0.91
-            elif brown_spots and texture_variation:
-                return "Early Blight", 0.89
-            elif yellow_patches:
-                return "Bacterial Spot", 0.86
-        elif crop_type.lower() == "wheat":
-            if red_mean > 140 and texture_variation:
-                return "Wheat Rust", 0.90
-        elif crop_type.lower() == "rice":
-            if brown_spots and texture_variation:
-                return "Blast Disease", 0.88
-        elif crop_type.lower() == "corn":
-            if brown_spots and texture_variation:
-                return "Corn Leaf Blight", 0.87
-        
-        # If no specific disease patterns detected, check if healthy
-        green_dominance = green_mean > (red_mean * 1.15) and green_mean > (blue_mean * 1.1)
-        is_uniform = green_std < 45
-        
-        if green_dominance and is_uniform and green_mean > 110:
-            return "Healthy Plant", 0.90
-        
-        # Default to most common disease for crop if unclear
-        return "General Plant Disease", 0.75
-        
-    except Exception as e:
-        return "Healthy Plant", 0.80
+        timeout = float(timeout_ms) / 1000
+    except ValueError:
+        return None
+    elapsed = time.perf_counter() - request.state.received_at
+    return asyncio.get_running_loop().time() + timeout - elapsed
+
+# Registered before record_arrival so that it runs inside it, after the size check
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if admission is None or not request.url.path.startswith("/predict"):
+        return await call_next(request)
+
+    try:
+        await admission.acquire(request_deadline(request))
+    except Shed as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"Service overloaded ({e.reason}), retry later"},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(time.perf_counter() - started)
+
+@app.middleware("http")
+async def record_arrival(request: Request, call_next):
+    # Lets handlers tell how long body parsing took before they were called
+    request.state.received_at = time.perf_counter()
+
+    # Refuse oversized bodies from their Content-Length, before any parsing
+    limit = configured_byte_limit(request.url.path)
+    content_length = request.headers.get("content-length", "")
+    if limit and content_length.isdigit() and int(content_length) > limit:
+        REJECTED_UPLOADS.inc(reason="too_many_bytes")
+        return JSONResponse(status_code=413, content={"detail": f"Request body is larger than {limit} bytes"})
+
+    return await call_next(request)
+
+@app.exception_handler(PoolUnavailable)
+async def pool_unavailable_handler(request: Request, exc: PoolUnavailable):
+    retry_after = 1
+    if executor_retry_at is not None:
+        retry_after = max(1, math.ceil(executor_retry_at - asyncio.get_running_loop().time()))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Analysis workers are unavailable ({exc}), retry later"},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+@app.exception_handler(UploadRejected)
+async def upload_rejected_handler(request: Request, exc: UploadRejected):
+    REJECTED_UPLOADS.inc(reason=exc.reason)
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+async def read_upload(chunks):
+    """Stream an upload in, enforcing the configured byte and pixel limits"""
+    image_data, _ = await read_image_stream(chunks, config.MAX_UPLOAD_BYTES, config.MAX_IMAGE_PIXELS)
+    return image_data
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Runs in the background so /health answers while the pool starts
+    global executor_attempted, warm_up_task
+    executor_attempted = asyncio.Event()
+    warm_up_task = asyncio.get_running_loop().create_task(warm_up())
+
+async def warm_up():
+    """Import the analysis stack, start the pool and run a synthetic prediction"""
+    global analysis_executor, service_ready, executor_started, executor_error, executor_retry_at
+    loop = asyncio.get_running_loop()
+    delay = EXECUTOR_RETRY_SECONDS
+    while True:
+        try:
+            # NumPy and Pillow are only loaded here, off the event loop
+            analysis = await loop.run_in_executor(None, importlib.import_module, "analysis")
+            STARTUP_SECONDS.setdefault("analysis_import", time.perf_counter() - IMPORT_STARTED)
+
+            analysis_executor = await loop.run_in_executor(
+                None, create_executor, config.EXECUTOR_BACKEND, config.EXECUTOR_WORKERS, analysis.warm_up
+            )
+            STARTUP_SECONDS["executor"] = time.perf_counter() - IMPORT_STARTED
+            break
+        except Exception as e:
+            # Requests get 503 meanwhile; running them inline would stall the event loop
+            logger.exception("Starting the analysis pool failed, retrying in %.0f s", delay)
+            executor_error = f"{type(e).__name__}: {e}"
+            executor_retry_at = loop.time() + delay
+            executor_attempted.set()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, EXECUTOR_RETRY_MAX_SECONDS)
+
+    executor_started = True
+    executor_error = executor_retry_at = None
+    executor_attempted.set()
+
+    try:
+        # Same hand-off as a request, bypassing the caches and request metrics
+        images = await loop.run_in_executor(None, analysis.warm_up_images)
+        await run_in_executor(
+            analysis_executor, analysis.analyze_images_profiled, images, ["tomato"] * len(images),
+            config.DECODE_MAX_PIXELS, config.TILE_RULES_ENABLED,
+        )
+        render_prediction("Late Blight", 0.9, "tomato")
+    except Exception:
+        logger.exception("Warm-up prediction failed")
+        return
+
+    STARTUP_SECONDS["ready"] = time.perf_counter() - IMPORT_STARTED
+    service_ready = True
+
+def encode_catalog_bodies():
+    return {
+        key: PrecompressedBody(body, max_age=config.CATALOG_MAX_AGE_SECONDS)
+        for key, body in catalog_documents().items()
+    }
+
+@app.on_event("startup")
+async def build_catalog_bodies():
+    # Compressing at the highest levels takes a while, so it runs off the event loop
+    global catalog_bodies
+    catalog_bodies = await asyncio.get_running_loop().run_in_executor(None, encode_catalog_bodies)
+
+@app.on_event("startup")
+async def start_admission_control():
+    global admission
+    if config.ADMISSION_MAX_CONCURRENCY > 0:
+        admission = AdmissionController(
+            config.ADMISSION_MAX_CONCURRENCY, config.ADMISSION_MAX_QUEUE, config.ADMISSION_MAX_WAIT_MS / 1000
+        )
+
+@app.on_event("startup")
+async def start_result_cache():
+    global result_cache, cache_namespace
+    cache_namespace = decision_namespace(MODEL_VERSION, config.RULES_PATH)
+    result_cache = create_result_cache(
+        config.CACHE_BACKEND, config.CACHE_MAX_BYTES, config.CACHE_TTL_SECONDS, config.CACHE_PATH
+    )
+
+@app.on_event("startup")
+async def start_near_duplicate_index():
+    global near_duplicates
+    if config.PHASH_ENABLED:
+        near_duplicates = NearDuplicateIndex(
+            config.PHASH_MAX_ENTRIES, config.PHASH_MAX_DISTANCE, config.PHASH_MAX_COLOR_DELTA
+        )
+
+@app.on_event("startup")
+async def start_job_store():
+    global job_store, job_slots, job_sweeper
+    job_store = create_job_store(config.JOB_STORE_BACKEND, config.JOB_TTL_SECONDS, config.JOB_STORE_PATH)
+    job_slots = asyncio.Semaphore(config.JOB_WORKERS)
+    job_sweeper = asyncio.get_running_loop().create_task(sweep_jobs())
+
+async def sweep_jobs():
+    """Periodically drop finished jobs past their TTL"""
+    interval = max(1, min(60, config.JOB_TTL_SECONDS))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            job_store.sweep()
+        except Exception:
+            logger.exception("Job cleanup failed")
+
+@app.on_event("startup")
+async def start_micro_batcher():
+    global micro_batcher
+    if config.BATCHING_ENABLED:
+        micro_batcher = MicroBatcher(
+            analyze_batch,
+            window_ms=config.BATCH_WINDOW_MS,
+            max_batch_size=config.BATCH_MAX_SIZE,
+            max_inflight=config.EXECUTOR_WORKERS if config.EXECUTOR_BACKEND != "inline" else 1,
+        )
+        micro_batcher.start()
+
+@app.on_event("shutdown")
+async def stop_micro_batcher():
+    global micro_batcher
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+        micro_batcher = None
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    global job_sweeper
+    if job_sweeper is not None:
+        job_sweeper.cancel()
+        job_sweeper = None
+    for task in list(job_tasks.values()):
+        task.cancel()
+
+@app.on_event("shutdown")
+async def stop_analysis_executor():
+    global analysis_executor, warm_up_task
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+        warm_up_task = None
+    if analysis_executor is not None:
+        analysis_executor.shutdown(wait=False, cancel_futures=True)
+        analysis_executor = None
 
 @app.get("/")
 async def root():
@@ -363,138 +468,426 @@ async def root():
         "status": "running",
         "endpoints": {
             "health": "/health",
-            "predict": "/predict (POST)"
+            "ready": "/ready",
+            "predict": "/predict (POST)",
+            "predict_batch": "/predict/batch (POST)",
+            "predict_raw": "/predict/raw (POST, application/octet-stream)",
+            "predict_base64": "/predict/base64 (POST, application/json)",
+            "jobs": "/jobs (POST), /jobs/{id}?wait=seconds (GET)",
+            "catalog": "/catalog, /catalog/{crop} (GET)",
+            "metrics": "/metrics"
         }
     }
 
 @app.get("/health")
 async def health_check():
     return {
-        "status": "healthy", 
+        "status": "healthy",
+        "ready": service_ready,
         "service": "CropCare ML Service - Authoritative Source",
         "version": "2.0.0",
-        "timestamp": "2024-01-01T00:00:00Z",
-        "note": "This service is the sole source for disease detection, crop identification, and treatment recommendations"
+        "timestamp": utc_timestamp(),
+        "note": "This service is the sole source for disease detection, crop identification, and treatment recommendations",
+        "cache": await cache_call(result_cache.stats) if result_cache is not None else None,
+        "near_duplicates": near_duplicates.stats() if near_duplicates is not None else None,
+        "batching": micro_batcher.stats() if micro_batcher is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "jobs": dict(job_store.stats(), pending=len(job_tasks)) if job_store is not None else None
     }
 
-@app.post("/predict")
-async def predict_disease(file: UploadFile = File(...), crop: str = Form(...)):
+@app.get("/ready")
+async def readiness_check():
+    """200 once the analysis pool is up and warmed, 503 before"""
+    if not service_ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "error": executor_error})
+    return {"status": "ready", "startup_seconds": STARTUP_SECONDS}
+
+@app.get("/metrics")
+async def metrics():
+    global cache_snapshot
+    # Read once per scrape, off the event loop for the SQLite cache, and shared by the cache gauges
+    cache_snapshot = await cache_call(result_cache.stats) if result_cache is not None else None
+    return Response(content=METRICS.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def catalog_response(request, body):
+    response, coding = body.response(request)
+    CATALOG_RESPONSES.inc(coding=coding)
+    return response
+
+@app.get("/catalog")
+async def get_catalog(request: Request):
+    """Every crop's disease records, for joining against compact predictions"""
+    return catalog_response(request, catalog_bodies[None])
+
+@app.get("/catalog/{crop}")
+async def get_crop_catalog(request: Request, crop: str):
+    """One crop's disease records; crops the catalog doesn't list get the default records"""
+    body = catalog_bodies.get(normalize_crop(crop)) or catalog_bodies[DEFAULT_CATALOG_KEY]
+    return catalog_response(request, body)
+
+async def run_analysis(func, *args):
+    """Run func on the analysis pool, waiting for the pool to be started
+
+    Raises PoolUnavailable while starting the pool fails and is being retried.
+    """
+    if not executor_started:
+        await executor_attempted.wait()
+        if not executor_started:
+            raise PoolUnavailable(executor_error)
+    return await run_in_executor(analysis_executor, func, *args)
+
+def analysis_chunks(count):
+    """Split count images into contiguous (start, stop) ranges, one per pool worker"""
+    workers = config.EXECUTOR_WORKERS if config.EXECUTOR_BACKEND != "inline" else 1
+    chunks = max(1, min(workers, count))
+    size, extra = divmod(count, chunks)
+    bounds = [0]
+    for i in range(chunks):
+        bounds.append(bounds[-1] + size + (1 if i < extra else 0))
+    return list(zip(bounds, bounds[1:]))
+
+async def analyze_chunk(images, crops):
+    from analysis import analyze_images_profiled
+
+    detections, profile = await run_analysis(
+        analyze_images_profiled, images, crops, config.DECODE_MAX_PIXELS, config.TILE_RULES_ENABLED
+    )
+    for stage, seconds in profile["stages"].items():
+        ANALYSIS_STAGE_SECONDS.observe(seconds, stage=stage)
+    for path, count in profile["fallbacks"].items():
+        FALLBACKS.inc(count, path=path)
+    return [(detection, profile) for detection in detections]
+
+async def analyze_batch(images, crops):
+    """Analysis backend: run a batch of images on the worker pool
+
+    The batch is split into one chunk per worker so every worker decodes in
+    parallel. Returns one (detection, chunk profile) pair per image, in order.
+    """
+    chunks = await asyncio.gather(*[
+        analyze_chunk(images[start:stop], crops[start:stop]) for start, stop in analysis_chunks(len(images))
+    ])
+    return [item for chunk in chunks for item in chunk]
+
+async def cache_call(func, *args):
+    """Call a result cache method, on the default thread pool when the cache does file I/O"""
+    if result_cache.blocking:
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    return func(*args)
+
+async def detect_disease(image_data, crop, profile=None):
+    """Return the (disease, confidence) decision for one image, reusing cached decisions"""
+    return (await detect_diseases([image_data], [crop], profile))[0]
+
+async def detect_diseases(images, crops, profile=None):
+    """Decisions for several images; only cache misses are sent to the worker pool"""
+    detections = [None] * len(images)
+    keys = [None] * len(images)
+    fingerprints = [None] * len(images)
+
+    started = time.perf_counter()
+    if result_cache is not None:
+        keys = [
+            make_cache_key(image_data, crop, config.DECODE_MAX_PIXELS, config.TILE_RULES_ENABLED, cache_namespace)
+            for image_data, crop in zip(images, crops)
+        ]
+        detections = await cache_call(result_cache.get_many, keys)
+    pending = [i for i, detection in enumerate(detections) if detection is None]
+    looked_up = time.perf_counter()
+    add_stage(profile, "cache", looked_up - started)
+
+    if pending and near_duplicates is not None:
+        # Near-duplicates of earlier uploads reuse their decision
+        hashed = await run_analysis(fingerprint_images, [images[i] for i in pending])
+        unmatched = []
+        for i, fingerprint in zip(pending, hashed):
+            fingerprints[i] = fingerprint
+            detections[i] = near_duplicates.get(fingerprint, crops[i], config.DECODE_MAX_PIXELS)
+            if detections[i] is None:
+                unmatched.append(i)
+        matched = [(keys[i], detections[i]) for i in pending if detections[i] is not None]
+        if matched and result_cache is not None:
+            await cache_call(result_cache.set_many, matched)
+        pending = unmatched
+        started, looked_up = looked_up, time.perf_counter()
+        add_stage(profile, "phash", looked_up - started)
+
+    if len(pending) == 1 and micro_batcher is not None:
+        # Lone images are merged with other concurrent requests
+        analyzed = [await micro_batcher.submit(images[pending[0]], crops[pending[0]])]
+    elif pending:
+        analyzed = await analyze_batch([images[i] for i in pending], [crops[i] for i in pending])
+    else:
+        analyzed = []
+
+    if pending:
+        # Wall time includes queueing and pool hand-off on top of the worker stages
+        add_stage(profile, "analyze", time.perf_counter() - looked_up)
+        if profile is not None:
+            # Items of one chunk share its profile; merge each once
+            for batch_profile in {id(p): p for _, p in analyzed}.values():
+                merge_profile(profile, batch_profile)
+
+    for i, (detection, _) in zip(pending, analyzed):
+        detections[i] = detection
+        if near_duplicates is not None:
+            near_duplicates.add(fingerprints[i], crops[i], config.DECODE_MAX_PIXELS, detection)
+    if pending and result_cache is not None:
+        await cache_call(result_cache.set_many, [(keys[i], detections[i]) for i in pending])
+
+    return detections
+
+def crop_label(crop):
+    """Bounded metric label for a user-supplied crop name"""
+    crop_key = normalize_crop(crop)
+    return crop_key if crop_key in DISEASE_DATABASE else "other"
+
+def start_profile(request):
+    """Profile for a prediction request, seeded with the body parsing time"""
+    profile = new_profile()
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        add_stage(profile, "parse", time.perf_counter() - received_at)
+    return profile
+
+def finish_response(request, endpoint, profile, body):
+    """Record the request's stage timings and build its JSON response"""
+    finished = time.perf_counter()
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        add_stage(profile, "total", finished - received_at)
+    STARTUP_SECONDS.setdefault("first_prediction", finished - IMPORT_STARTED)
+    for stage, seconds in profile["stages"].items():
+        REQUEST_STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+
+    headers = None
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes", "on"):
+        headers = {"Server-Timing": server_timing_header(profile)}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def render_detection(detected_disease, confidence, crop, profile, compact=False):
+    started = time.perf_counter()
+    body = render_prediction(detected_disease, confidence, crop, compact)
+    add_stage(profile, "render", time.perf_counter() - started)
+    PREDICTIONS.inc(crop=crop_label(crop), disease=detected_disease)
+    return body
+
+def render_failure(crop, path, profile, compact=False):
+    add_fallback(profile, path)
+    FALLBACKS.inc(path=path)
+    return render_fallback(crop, compact)
+
+async def predict_image(request, endpoint, image_data, crop, profile, compact=False):
+    """Shared tail of the single-image endpoints: analyze, render and respond"""
     try:
-        # Read and validate image
-        image_data = await file.read()
         if len(image_data) == 0:
-            raise ValueError("Empty image file")
+            return finish_response(request, endpoint, profile, render_failure(crop, "empty_upload", profile, compact))
         
         # Analyze image for disease detection
-        detected_disease, confidence = analyze_image_for_disease(image_data, crop)
-        
-        # If healthy plant detected
-        if detected_disease == "Healthy Plant":
-            return {
-                "name": "Healthy Plant",
-                "confidence": confidence,
-                "severity": "None",
-                "description": f"The {crop.title()} plant appears to be healthy with no visible signs of disease. Continue with regular care and monitoring.",
-                "symptoms": ["Vibrant green foliage", "No visible spots or lesions", "Good plant structure", "Healthy leaf color"],
-                "treatment": {
-                    "organic": [
-                        {
-                            "name": "Preventive Care",
-                            "dosage": "Regular monitoring",
-                            "frequency": "Daily observation",
-                            "effectiveness": 100,
-                            "instructions": "Continue current care routine. Monitor for any changes in plant health."
-                        }
-                    ],
-                    "chemical": [
-                        {
-                            "name": "No Treatment Needed",
-                            "dosage": "N/A",
-                            "frequency": "N/A",
-                            "effectiveness": 100,
-                            "warning": "Plant is healthy - no chemical treatment required.",
-                            "instructions": "Maintain current growing conditions and continue monitoring."
-                        }
-                    ]
-                },
-                "prevention": ["Continue proper watering", "Maintain good air circulation", "Regular monitoring", "Balanced nutrition"],
-                "analyzed_crop": crop.title(),
-                "analysis_timestamp": "2024-01-01T00:00:00Z",
-                "model_version": "v2.1.0",
-                "health_status": "healthy"
-            }
+        detected_disease, confidence = await detect_disease(image_data, crop, profile)
         
-        # Get diseases for the specified crop
-        crop_key = crop.lower().strip()
-        available_diseases = DISEASE_DATABASE.get(crop_key, DEFAULT_DISEASES)
+        body = render_detection(detected_disease, confidence, crop, profile, compact)
         
-        # Find the specific disease or use general disease
-        if detected_disease == "General Plant Disease":
-            selected_disease = DEFAULT_DISEASES[0].copy()
-        else:
-            # Find matching disease in database
-            selected_disease = None
-            for disease in available_diseases:
-                if disease["name"] == detected_disease:
-                    selected_disease = disease.copy()
-                    break
-            
-            # If specific disease not found, use first available disease
-            if not selected_disease:
-                selected_disease = available_diseases[0].copy()
-        
-        # Set the detected confidence
-        selected_disease["confidence"] = confidence
-        
-        # Add metadata
-        selected_disease["analyzed_crop"] = crop.title()
-        selected_disease["analysis_timestamp"] = "2024-01-01T00:00:00Z"
-        selected_disease["model_version"] = "v2.1.0"
-        
-        return selected_disease
-        
-    except Exception as e:
-        print(f"Prediction error: {str(e)}")
+    except PoolUnavailable:
+        raise
+    except Exception:
+        logger.exception("Prediction failed for crop %r", crop)
         # Return fallback diagnosis
-        return {
-            "name": "Plant Disease Detected",
-            "confidence": 0.75,
-            "severity": "Medium",
-            "description": "A potential plant disease has been identified. The AI system detected abnormal patterns that suggest disease presence. Please consult with an agricultural expert for proper identification and treatment.",
-            "symptoms": ["Abnormal leaf patterns detected", "Potential disease symptoms visible", "Plant health indicators suggest intervention needed"],
-            "treatment": {
-                "organic": [
-                    {
-                        "name": "Neem Oil Spray",
-                        "dosage": "5ml per liter of water",
-                        "frequency": "Every 7-10 days",
-                        "effectiveness": 75,
-                        "instructions": "Apply in early morning or evening. General purpose organic treatment for most plant diseases."
-                    },
-                    {
-                        "name": "Copper Fungicide (Organic)",
-                        "dosage": "2g per liter of water",
-                        "frequency": "Every 10-14 days",
-                        "effectiveness": 80,
-                        "instructions": "Broad spectrum organic fungicide. Follow label instructions carefully."
-                    }
-                ],
-                "chemical": [
-                    {
-                        "name": "Broad Spectrum Fungicide",
-                        "dosage": "As per manufacturer instructions",
-                        "frequency": "Every 10-14 days",
-                        "effectiveness": 85,
-                        "warning": "Always read and follow label instructions. Use protective equipment.",
-                        "instructions": "Consult local agricultural extension office for specific recommendations based on your region."
-                    }
-                ]
-            },
-            "prevention": ["Maintain proper plant spacing", "Ensure good air circulation", "Avoid overhead watering", "Monitor plants regularly"],
-            "analyzed_crop": crop.title(),
-            "analysis_timestamp": "2024-01-01T00:00:00Z",
-            "model_version": "v2.1.0-fallback"
-        }
+        body = render_failure(crop, "prediction_error", profile, compact)
+
+    return finish_response(request, endpoint, profile, body)
+
+@app.post("/predict")
+async def predict_disease(request: Request, file: UploadFile = File(...), crop: str = Form(...), compact: bool = False):
+    """Diagnosis for one uploaded image; ?compact=true leaves out the catalog record"""
+    profile = start_profile(request)
+    started = time.perf_counter()
+    image_data = await read_upload(iter_upload_file(file, config.UPLOAD_CHUNK_BYTES))
+    add_stage(profile, "read", time.perf_counter() - started)
+    return await predict_image(request, "predict", image_data, crop, profile, compact)
+
+@app.post("/predict/raw")
+async def predict_disease_raw(request: Request, crop: str = None, compact: bool = False):
+    """Image bytes as the request body; crop from the X-Crop header or ?crop=
+
+    Skips multipart parsing and temp-file spooling: the body is streamed in,
+    checked as it arrives and handed to the decoder as one buffer.
+    """
+    crop = crop or request.headers.get("x-crop")
+    if not crop:
+        raise HTTPException(status_code=422, detail="Pass the crop in the X-Crop header or the crop query parameter")
+
+    profile = start_profile(request)
+    started = time.perf_counter()
+    image_data = await read_upload(request.stream())
+    add_stage(profile, "read", time.perf_counter() - started)
+    return await predict_image(request, "predict_raw", image_data, crop, profile, compact)
+
+@app.post("/predict/base64")
+async def predict_disease_base64(request: Request, compact: bool = False):
+    """JSON body {"crop": ..., "image": <base64 or data: URL>}"""
+    profile = start_profile(request)
+    started = time.perf_counter()
+    try:
+        payload = loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Request body is not valid JSON")
+    crop = payload.get("crop") if isinstance(payload, dict) else None
+    encoded = payload.get("image") if isinstance(payload, dict) else None
+    if not isinstance(crop, str) or not isinstance(encoded, str):
+        raise HTTPException(status_code=422, detail="Expected a JSON object with string crop and image fields")
+
+    # Accept data URLs as produced by FileReader.readAsDataURL
+    if encoded.startswith("data:"):
+        encoded = encoded.partition(",")[2]
+    try:
+        image_data = base64.b64decode(encoded, validate=True)
+    except binascii.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image data: {e}")
+    image_data = await read_upload(iter_bytes(image_data))
+    add_stage(profile, "read", time.perf_counter() - started)
+
+    return await predict_image(request, "predict_base64", image_data, crop, profile, compact)
+
+@app.post("/predict/batch")
+async def predict_disease_batch(request: Request, files: List[UploadFile] = File(...), crops: List[str] = Form(...),
+                                compact: bool = False):
+    """Score several images in one request; one crop per file, or a single crop for all"""
+    profile = start_profile(request)
+    crops = batch_crops(files, crops)
+
+    started = time.perf_counter()
+    images = await read_uploads(files)
+    add_stage(profile, "read", time.perf_counter() - started)
+
+    body = await score_images(images, crops, profile, compact)
+    return finish_response(request, "predict_batch", profile, body)
+
+async def read_uploads(files):
+    """Stream in several uploads; a rejected one fails the lot, naming its index"""
+    images = []
+    for i, file in enumerate(files):
+        try:
+            images.append(await read_upload(iter_upload_file(file, config.UPLOAD_CHUNK_BYTES)))
+        except UploadRejected as e:
+            raise UploadRejected(e.status_code, e.reason, f"File {i} ({file.filename}): {e.detail}")
+    return images
+
+def batch_crops(files, crops):
+    """One crop per file, expanding a single crop to all of them"""
+    if len(files) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} images per batch")
+    if len(crops) == 1:
+        crops = crops * len(files)
+    if len(crops) != len(files):
+        raise HTTPException(status_code=400, detail="Provide one crop per file or a single crop for all files")
+    return crops
+
+async def score_images(images, crops, profile, compact=False):
+    """Analyze several images together and render the batch response body"""
+    # Empty uploads get the fallback diagnosis, everything else is analyzed together
+    indexes = [i for i, image_data in enumerate(images) if len(image_data) > 0]
+    try:
+        detections = await detect_diseases([images[i] for i in indexes], [crops[i] for i in indexes], profile)
+    except PoolUnavailable:
+        raise
+    except Exception:
+        logger.exception("Batch prediction failed")
+        detections = [None] * len(indexes)
+
+    results = [None] * len(crops)
+    for i, detection in zip(indexes, detections):
+        if detection is None:
+            results[i] = render_failure(crops[i], "batch_error", profile, compact)
+            continue
+        detected_disease, confidence = detection
+        try:
+            results[i] = render_detection(detected_disease, confidence, crops[i], profile, compact)
+        except Exception:
+            logger.exception("Rendering failed for crop %r", crops[i])
+            results[i] = render_failure(crops[i], "prediction_error", profile, compact)
+    for i, crop in enumerate(crops):
+        if results[i] is None:
+            results[i] = render_failure(crop, "empty_upload", profile, compact)
+
+    return b'{"count":%d,"results":[%s]}' % (len(results), b",".join(results))
+
+async def run_job(job, images, crops, compact=False):
+    """Background task behind POST /jobs"""
+    try:
+        async with job_slots:
+            job.status = "running"
+            job.started_at = time.time()
+            job_store.save(job)
+
+            profile = new_profile()
+            try:
+                job.result = await score_images(images, crops, profile, compact)
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Job %s failed", job.id)
+                job.status = "failed"
+                job.error = str(e) or type(e).__name__
+            job.finished_at = time.time()
+            job.stages = profile["stages"]
+            job_store.save(job)
+    finally:
+        job_tasks.pop(job.id, None)
+        event = job_events.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, files: List[UploadFile] = File(...), crops: List[str] = Form(...),
+                     compact: bool = False):
+    """Queue images for analysis and return a job id straight away
+
+    Takes the same form fields as /predict/batch; the result, once ready, is
+    the /predict/batch response body under "result" in GET /jobs/{id}.
+    """
+    crops = batch_crops(files, crops)
+    if len(job_tasks) >= config.JOB_MAX_PENDING:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Too many pending jobs, retry later"},
+            headers={"Retry-After": "5"},
+        )
+    images = await read_uploads(files)
+
+    job = Job(new_job_id(), len(images))
+    job_store.add(job)
+    job_events[job.id] = asyncio.Event()
+    job_tasks[job.id] = asyncio.get_running_loop().create_task(run_job(job, images, crops, compact))
+    return JSONResponse(
+        status_code=202,
+        content={"id": job.id, "status": job.status, "url": f"/jobs/{job.id}"},
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Job status and, once finished, its result; wait=N long-polls up to N seconds"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(max(wait, 0), config.JOB_MAX_WAIT_SECONDS)
+    while True:
+        job = job_store.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired job")
+        remaining = deadline - loop.time()
+        if job.finished or remaining <= 0:
+            return Response(content=job.render(), media_type="application/json")
+
+        event = job_events.get(job_id)
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), remaining)
+            else:
+                # Run by another worker process sharing the SQLite store
+                await asyncio.sleep(min(remaining, JOB_POLL_INTERVAL_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+
+STARTUP_SECONDS["import"] = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
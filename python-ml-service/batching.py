@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-image analyses into batched backend calls
+
+    backend is an async callable taking (images, crops) and returning one
+    result per image, in order; it is the place a real model would plug in.
+    At most max_inflight batches run at once. While they are busy, new
+    requests wait in the queue and go out together in the next batch. The
+    optional window adds a short wait after the first item of a batch so
+    that more requests can join it.
+    """
+
+    def __init__(self, backend, window_ms=0.0, max_batch_size=32, max_inflight=1):
+        self.backend = backend
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_inflight = max_inflight
+        self.batches = 0
+        self.items = 0
+        self.queue_wait_seconds = 0.0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._inflight = set()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while not self._queue.empty():
+            _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, image_data, crop):
+        """Queue one image and wait for the backend's result for it"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_data, crop, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.window_seconds
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                self._slots.release()
+                raise
+
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            # Requests abandoned while queued (e.g. client disconnects) are skipped
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            self._record_batch(len(batch), sum(started - item[3] for item in batch))
+
+            try:
+                detections = await self.backend([item[0] for item in batch], [item[1] for item in batch])
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, _, future, _), detection in zip(batch, detections):
+                if not future.done():
+                    future.set_result(detection)
+        finally:
+            self._slots.release()
+
+    def _record_batch(self, size, queue_wait_seconds):
+        self.batches += 1
+        self.items += size
+        self.queue_wait_seconds += queue_wait_seconds
+        for bucket, upper in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= upper:
+                self.batch_size_counts[bucket] += 1
+                break
+        else:
+            self.batch_size_counts[-1] += 1
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "inflight_batches": len(self._inflight),
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_queue_wait_ms": self.queue_wait_seconds / self.items * 1000 if self.items else 0.0,
+            "batch_sizes": {
+                **{f"le_{upper}": count for upper, count in zip(BATCH_SIZE_BUCKETS, self.batch_size_counts)},
+                f"gt_{BATCH_SIZE_BUCKETS[-1]}": self.batch_size_counts[-1],
+            },
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch_size,
+        }
@@ -0,0 +1,122 @@
+"""Benchmark suite for the ML service
+
+Usage:
+    python -m benchmarks [--output results.json] [--baseline previous.json]
+                         [--sizes 256px,1MP,...] [--repeat N]
+                         [--requests N] [--concurrency 1,8,32] [--skip-load]
+                         [--threshold 0.15]
+
+Runs the micro-benchmarks on the synthetic corpus and the in-process /predict
+load test, writes everything to a JSON file and, given a baseline from an
+earlier run, lists the timings that got slower.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+# Each load request must reach the analysis, not the result cache
+os.environ.setdefault("ML_CACHE_BACKEND", "off")
+
+from benchmarks import corpus, load, micro  # noqa: E402
+
+# Slowdown beyond which a timing is reported as a regression
+REGRESSION_THRESHOLD = 0.15
+
+# Metric names by direction; anything else (counts, sizes) is not compared
+LOWER_IS_BETTER = ("median_ms", "best_ms", "per_response_us", "per_image_us", "ns_per_pixel", "p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("throughput_rps",)
+
+
+def environment():
+    import numpy
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "executor": os.getenv("ML_EXECUTOR", "process"),
+        "workers": os.getenv("ML_WORKERS", str(os.cpu_count())),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)):
+            yield path, value
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Metrics in current that are more than `threshold` worse than in baseline"""
+    previous = dict(flatten(baseline.get("results", {})))
+    regressions = []
+    for path, value in flatten(current["results"]):
+        if not previous.get(path):
+            continue
+        if path.endswith(LOWER_IS_BETTER):
+            change = value / previous[path] - 1
+        elif path.endswith(HIGHER_IS_BETTER):
+            change = previous[path] / value - 1 if value else float("inf")
+        else:
+            continue
+        if change > threshold:
+            regressions.append({"metric": path, "baseline": previous[path], "current": value, "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as a regression (default %(default)s)")
+    parser.add_argument("--sizes", default=",".join(corpus.SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--load-sizes", default="256px,1MP", help="corpus sizes used for the load test")
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes.split(",")
+    samples = corpus.generate(sizes=sizes)
+    mismatches = corpus.verify(samples)
+    if mismatches:
+        print(f"warning: {len(mismatches)} corpus samples miss their intended branch: {mismatches}", file=sys.stderr)
+
+    results = {"micro": micro.run(samples, args.repeat)}
+    if not args.skip_load:
+        load_samples = [sample for sample in samples if sample.size in args.load_sizes.split(",")]
+        levels = [int(level) for level in args.concurrency.split(",")]
+        results["load"] = asyncio.run(load.run(load_samples, args.requests, levels))
+
+    report = {"environment": environment(), "corpus": {"sizes": sizes, "samples": len(samples)}, "results": results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for level, summary in results.get("load", {}).items():
+        print(f"load {level}: {summary['throughput_rps']:.1f} req/s, "
+              f"p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms")
+    for regression in report.get("regressions", []):
+        print(f"regression {regression['metric']}: {regression['baseline']:.3f} -> {regression['current']:.3f} "
+              f"({regression['change']:.0%} worse)")
+    print(f"results written to {args.output}")
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Micro-benchmark of channel feature extraction
+
+Usage:
+    python -m benchmarks.bench_features [--repeat N]
+
+Compares the original four-pass NumPy statistics (three np.mean calls and
+np.std on strided channel views) with the fused chunked kernel behind
+analysis.batch_channel_stats, reporting time per frame, peak extra memory and
+whether both feed the same decision for every crop.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from analysis import batch_channel_stats, classify_features
+
+SIZES = {"256px": (256, 256), "1MP": (1000, 1000), "3MP": (1500, 2000), "12MP": (3000, 4000)}
+CROPS = ("potato", "tomato", "wheat", "rice", "corn", "other")
+
+
+def legacy_channel_stats(img_array):
+    """The statistics exactly as analyze_image_for_disease computed them originally"""
+    red_mean = np.mean(img_array[:, :, 0])
+    green_mean = np.mean(img_array[:, :, 1])
+    blue_mean = np.mean(img_array[:, :, 2])
+    green_std = np.std(img_array[:, :, 1])
+    return [float(red_mean), float(green_mean), float(blue_mean), float(green_std)]
+
+
+def fused_channel_stats(img_array):
+    return [float(v) for v in batch_channel_stats([img_array])[0]]
+
+
+def measure(func, img_array, repeat):
+    func(img_array)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(img_array)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    func(img_array)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def synthetic_frame(shape, seed):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(40, 200, 3)
+    frame = rng.normal(base, rng.integers(10, 80), shape + (3,))
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def run(repeat):
+    results = {}
+    for seed, (label, shape) in enumerate(SIZES.items()):
+        img_array = synthetic_frame(shape, seed)
+        legacy, legacy_seconds, legacy_peak = measure(legacy_channel_stats, img_array, repeat)
+        fused, fused_seconds, fused_peak = measure(fused_channel_stats, img_array, repeat)
+        results[label] = {
+            "legacy_ms": legacy_seconds * 1000,
+            "fused_ms": fused_seconds * 1000,
+            "speedup": legacy_seconds / fused_seconds,
+            "legacy_peak_bytes": legacy_peak,
+            "fused_peak_bytes": fused_peak,
+            "same_decisions": all(
+                classify_features(*legacy, crop) == classify_features(*fused, crop) for crop in CROPS
+            ),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
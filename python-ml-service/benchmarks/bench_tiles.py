@@ -0,0 +1,49 @@
+"""Micro-benchmark of the tile feature engine
+
+Usage:
+    python -m benchmarks.bench_tiles [--repeat N] [--grid N]
+
+Times the whole-image statistics behind analysis.batch_channel_stats alone
+and together with the per-tile statistics used by the tile rules, reporting
+the cost of the tile pass as a multiple of the global one and the peak extra
+memory of each. The tile view is checked to share memory with the frame.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from analysis import TILE_GRID, batch_channel_stats, batch_tile_features, tile_view
+from benchmarks.bench_features import SIZES, measure, synthetic_frame
+
+
+def run(repeat, grid=TILE_GRID):
+    results = {}
+    for seed, (label, shape) in enumerate(SIZES.items()):
+        img_array = synthetic_frame(shape, seed)
+        _, global_seconds, global_peak = measure(lambda a: batch_channel_stats([a]), img_array, repeat)
+        _, tile_seconds, tile_peak = measure(lambda a: batch_tile_features([a], grid), img_array, repeat)
+        results[label] = {
+            "global_ms": global_seconds * 1000,
+            "tiles_ms": tile_seconds * 1000,
+            "tiles_cost_ratio": tile_seconds / global_seconds,
+            "combined_cost_ratio": (global_seconds + tile_seconds) / global_seconds,
+            "global_peak_bytes": global_peak,
+            "tiles_peak_bytes": tile_peak,
+            "zero_copy_view": bool(np.shares_memory(tile_view(img_array, grid), img_array)),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grid", type=int, default=TILE_GRID)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.repeat, args.grid), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
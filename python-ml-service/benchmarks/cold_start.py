@@ -0,0 +1,101 @@
+"""Cold-start timings of the ML service
+
+Usage:
+    python -m benchmarks.cold_start [--runs N]
+
+Starts the service in a fresh interpreter per run and reports, in seconds
+from the start of the app module import, when the import finished, when
+/health first answered, when /ready first returned 200 and when the first
+/predict response was complete. Medians over the runs are printed as JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in the child interpreter; prints one JSON line of timings. Requests
+# are raw ASGI calls so no HTTP client is imported, and the analysis module
+# is only imported once /ready says the warm-up has loaded it.
+CHILD = r"""
+import time
+started = time.perf_counter()
+import app as service
+timings = {"import": time.perf_counter() - started}
+
+import asyncio, json
+
+async def call(method, path, query=b"", body=b""):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query, "root_path": "",
+        "headers": [(b"host", b"cold-start"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("cold-start", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await service.app(scope, receive, send)
+    return status[0]
+
+async def main():
+    await service.app.router.startup()
+    await call("GET", "/health")
+    timings["health"] = time.perf_counter() - started
+    while await call("GET", "/ready") != 200:
+        await asyncio.sleep(0.005)
+    timings["ready"] = time.perf_counter() - started
+
+    from analysis import warm_up_images
+    image = warm_up_images()[0]
+    sent = time.perf_counter()
+    timings["first_prediction_status"] = await call("POST", "/predict/raw", b"crop=tomato", image)
+    timings["first_prediction"] = timings["ready"] + time.perf_counter() - sent
+    await service.app.router.shutdown()
+    print(json.dumps(timings))
+
+asyncio.run(main())
+"""
+
+
+def run_once():
+    env = dict(os.environ, ML_CACHE_BACKEND="off")
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=service_dir, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs):
+    samples = [run_once() for _ in range(runs)]
+    phases = ("import", "health", "ready", "first_prediction")
+    return {
+        "runs": runs,
+        "executor": os.getenv("ML_EXECUTOR", "process"),
+        "median_seconds": {phase: statistics.median(sample[phase] for sample in samples) for phase in phases},
+        "statuses": sorted({sample["first_prediction_status"] for sample in samples}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.runs), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
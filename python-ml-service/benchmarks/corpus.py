@@ -0,0 +1,118 @@
+"""Deterministic synthetic leaf-image corpus for benchmarks
+
+Every image is generated from a fixed seed, so two runs on any machine see
+byte-identical inputs. Colour regimes are chosen so that each branch of
+analyze_image_for_disease is exercised for the crop the sample is tagged
+with.
+"""
+import io
+import zlib
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+SIZES = {
+    "256px": (256, 256),
+    "1MP": (1152, 864),
+    "3MP": (2048, 1536),
+    "12MP": (4000, 3000),
+}
+FORMATS = ("jpeg", "png")
+
+# name: (crop, expected decision, leaf colour, blotch colour, blotch fraction, noise sigma)
+REGIMES = {
+    "healthy": ("tomato", "Healthy Plant", (70, 150, 60), (80, 165, 70), 0.3, 8),
+    "dark_lesions": ("tomato", "Late Blight", (140, 150, 130), (5, 5, 5), 0.5, 6),
+    "brown_spots": ("rice", "Blast Disease", (120, 200, 60), (220, 60, 40), 0.6, 6),
+    "rust": ("wheat", "Wheat Rust", (120, 200, 60), (220, 60, 40), 0.6, 6),
+    "yellow_patches": ("tomato", "Bacterial Spot", (200, 190, 50), (180, 170, 70), 0.3, 8),
+    "white_growth": ("potato", "Powdery Mildew", (225, 235, 230), (215, 228, 222), 0.3, 6),
+    "unclear": ("corn", "General Plant Disease", (120, 110, 130), (135, 120, 140), 0.3, 15),
+}
+
+
+class Sample:
+    __slots__ = ("name", "regime", "crop", "expected", "size", "format", "data", "pixels")
+
+    def __init__(self, name, regime, crop, expected, size, fmt, data, pixels):
+        self.name = name
+        self.regime = regime
+        self.crop = crop
+        self.expected = expected
+        self.size = size
+        self.format = fmt
+        self.data = data
+        self.pixels = pixels
+
+
+def _seed(*parts):
+    return zlib.crc32("/".join(parts).encode())
+
+
+def render_leaf(regime, shape, seed):
+    """RGB frame of a leaf-coloured field with smooth blotches of a second colour"""
+    _, _, leaf, blotch, fraction, sigma = REGIMES[regime]
+    width, height = shape
+    rng = np.random.default_rng(seed)
+
+    # Low-resolution noise upsampled into smooth blotches covering `fraction` of the frame
+    coarse = Image.fromarray((rng.random((24, 32)) * 255).astype(np.uint8))
+    field = np.asarray(coarse.resize((width, height), Image.BILINEAR))
+    mask = field < np.quantile(field, fraction)
+
+    frame = np.where(mask[..., None], np.array(blotch, dtype=np.float32), np.array(leaf, dtype=np.float32))
+    frame += rng.normal(0, sigma, (height, width, 1)).astype(np.float32)
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+
+    # A few leaf veins so the frames aren't pure noise fields
+    image = Image.fromarray(frame)
+    draw = ImageDraw.Draw(image)
+    vein = tuple(int(c * 0.85) for c in leaf)
+    for k in range(1, 6):
+        y = height * k // 6
+        draw.line([(0, height // 2), (width, y)], fill=vein, width=max(1, width // 400))
+    return image
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, "JPEG", quality=88)
+    else:
+        image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def generate(sizes=None, formats=FORMATS, regimes=None, grayscale=True):
+    """Build the corpus; sizes/formats/regimes restrict it to a subset"""
+    samples = []
+    for size in sizes or SIZES:
+        shape = SIZES[size]
+        for regime in regimes or REGIMES:
+            crop, expected = REGIMES[regime][:2]
+            image = render_leaf(regime, shape, _seed(regime, size))
+            for fmt in formats:
+                samples.append(Sample(
+                    f"{regime}-{size}.{fmt}", regime, crop, expected, size, fmt,
+                    encode(image, fmt), shape[0] * shape[1],
+                ))
+
+        if grayscale:
+            image = render_leaf("healthy", shape, _seed("grayscale", size)).convert("L")
+            samples.append(Sample(
+                f"grayscale-{size}.jpeg", "grayscale", "tomato", "Healthy Plant", size, "jpeg",
+                encode(image, "jpeg"), shape[0] * shape[1],
+            ))
+    return samples
+
+
+def verify(samples):
+    """Samples whose decision differs from the regime they were built for"""
+    from analysis import analyze_image_for_disease
+
+    mismatches = []
+    for sample in samples:
+        decision, _ = analyze_image_for_disease(sample.data, sample.crop)
+        if decision != sample.expected:
+            mismatches.append((sample.name, sample.expected, decision))
+    return mismatches
@@ -0,0 +1,100 @@
+"""Compare reduced-resolution decoding against full-resolution analysis
+
+Usage:
+    python -m benchmarks.decode_agreement REFERENCE_DIR [--max-pixels N] [--crop CROP]
+
+Images are read recursively from REFERENCE_DIR. Unless --crop is given, the
+crop of each image is the name of the folder it sits in (e.g. refset/tomato/1.jpg).
+The report is printed as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from analysis import FEATURE_NAMES, batch_channel_stats, classify_features, decode_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def iter_reference_images(root, crop=None):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, filename), crop or os.path.basename(dirpath)
+
+
+def analyze_once(image_data, crop, max_pixels):
+    """Decode and classify one image, returning (decision, features, decode seconds, array bytes)"""
+    started = time.perf_counter()
+    img_array = decode_image(image_data, max_pixels)
+    decode_seconds = time.perf_counter() - started
+
+    if len(img_array.shape) != 3 or img_array.shape[2] < 3:
+        return None, None, decode_seconds, img_array.nbytes
+
+    features = [float(v) for v in batch_channel_stats([img_array])[0]]
+    return classify_features(*features, crop), features, decode_seconds, img_array.nbytes
+
+
+def compare_decode_modes(samples, max_pixels):
+    """Run every (name, bytes, crop) sample at full and reduced resolution"""
+    mismatches = []
+    compared = 0
+    max_delta = dict.fromkeys(FEATURE_NAMES, 0.0)
+    totals = {"full_decode_seconds": 0.0, "reduced_decode_seconds": 0.0, "full_array_bytes": 0, "reduced_array_bytes": 0}
+
+    for name, image_data, crop in samples:
+        full, full_features, full_seconds, full_bytes = analyze_once(image_data, crop, 0)
+        reduced, reduced_features, reduced_seconds, reduced_bytes = analyze_once(image_data, crop, max_pixels)
+        compared += 1
+
+        totals["full_decode_seconds"] += full_seconds
+        totals["reduced_decode_seconds"] += reduced_seconds
+        totals["full_array_bytes"] = max(totals["full_array_bytes"], full_bytes)
+        totals["reduced_array_bytes"] = max(totals["reduced_array_bytes"], reduced_bytes)
+
+        if full_features and reduced_features:
+            for feature, a, b in zip(FEATURE_NAMES, full_features, reduced_features):
+                max_delta[feature] = max(max_delta[feature], abs(a - b))
+
+        if full != reduced:
+            mismatches.append({"image": name, "crop": crop, "full": full, "reduced": reduced})
+
+    return {
+        "max_pixels": max_pixels,
+        "images": compared,
+        "agreement": (compared - len(mismatches)) / compared if compared else None,
+        "mismatches": mismatches,
+        "max_feature_delta": max_delta,
+        "decode_speedup": (
+            totals["full_decode_seconds"] / totals["reduced_decode_seconds"]
+            if totals["reduced_decode_seconds"] else None
+        ),
+        "peak_array_bytes": {"full": totals["full_array_bytes"], "reduced": totals["reduced_array_bytes"]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reference_dir")
+    parser.add_argument("--max-pixels", type=int, default=1_000_000)
+    parser.add_argument("--crop", help="crop used for every image instead of the folder name")
+    args = parser.parse_args(argv)
+
+    samples = []
+    for path, crop in iter_reference_images(args.reference_dir, args.crop):
+        with open(path, "rb") as f:
+            samples.append((os.path.relpath(path, args.reference_dir), f.read(), crop))
+
+    if not samples:
+        print(f"No images found under {args.reference_dir}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(compare_decode_modes(samples, args.max_pixels), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""In-process load driver for /predict over an ASGI transport
+
+The app runs inside this process with its real startup hooks (worker pool,
+micro-batcher). Requests go through httpx's ASGI transport, so multipart
+encoding, parsing, analysis and response rendering are all exercised
+without any network in between.
+"""
+import asyncio
+import time
+from collections import Counter
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def drive(app, samples, requests=200, concurrency=16, path="/predict"):
+    """Send `requests` uploads cycling over samples with `concurrency` in flight"""
+    import httpx
+
+    latencies = []
+    statuses = Counter()
+    next_index = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < requests:
+                sample = samples[next_index % len(samples)]
+                next_index += 1
+                started = time.perf_counter()
+                response = await client.post(
+                    path,
+                    files={"file": (sample.name, sample.data, f"image/{sample.format}")},
+                    data={"crop": sample.crop},
+                )
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run(samples, requests=200, concurrency=(1, 8, 32)):
+    """Start the app, drive it at each concurrency level and shut it down"""
+    import app as service
+
+    await service.app.router.startup()
+    # Measure the warmed-up service, as a readiness probe would
+    await service.warm_up_task
+    try:
+        return {
+            f"c{level}": await drive(service.app, samples, requests, level)
+            for level in concurrency
+        }
+    finally:
+        await service.app.router.shutdown()
@@ -0,0 +1,98 @@
+"""Micro-benchmarks for the stages of a prediction: decode, features, response"""
+import statistics
+import time
+
+from analysis import batch_channel_stats, batch_tile_features, classify_batch, classify_features, decode_image
+from catalog import render_prediction
+
+# Rows classified at once by the bulk rule-table benchmark
+BULK_CLASSIFY_ROWS = 10_000
+
+
+def time_call(func, repeat):
+    """Median and best wall time of func() over `repeat` runs, after one warm-up"""
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {"median_ms": statistics.median(timings) * 1000, "best_ms": min(timings) * 1000}
+
+
+def bench_decode(samples, repeat):
+    results = {}
+    for sample in samples:
+        results[sample.name] = dict(time_call(lambda: decode_image(sample.data), repeat), pixels=sample.pixels)
+    return results
+
+
+def bench_features(samples, repeat):
+    results = {}
+    for sample in samples:
+        if sample.regime == "grayscale":
+            continue
+        img_array = decode_image(sample.data)
+        timing = time_call(lambda: batch_channel_stats([img_array]), repeat)
+        timing["ns_per_pixel"] = timing["median_ms"] * 1e6 / sample.pixels
+        results[sample.name] = timing
+    return results
+
+
+def bench_tiles(samples, repeat):
+    results = {}
+    for sample in samples:
+        if sample.regime == "grayscale":
+            continue
+        img_array = decode_image(sample.data)
+        timing = time_call(lambda: batch_tile_features([img_array]), repeat)
+        timing["ns_per_pixel"] = timing["median_ms"] * 1e6 / sample.pixels
+        results[sample.name] = timing
+    return results
+
+
+def bench_classify(samples, repeat):
+    rows = [
+        ([float(v) for v in batch_channel_stats([decode_image(sample.data)])[0]], sample.crop)
+        for sample in samples if sample.regime != "grayscale"
+    ]
+
+    def classify_all():
+        for features, crop in rows:
+            classify_features(*features, crop)
+
+    timing = time_call(classify_all, repeat)
+    timing["per_image_us"] = timing["median_ms"] * 1000 / max(1, len(rows))
+
+    # The same rows, repeated to a bulk-sized matrix, in one rule table call
+    copies = max(1, BULK_CLASSIFY_ROWS // max(1, len(rows)))
+    matrix = [features for features, _ in rows] * copies
+    crops = [crop for _, crop in rows] * copies
+    bulk = time_call(lambda: classify_batch(matrix, crops), repeat)
+    timing["bulk_per_image_us"] = bulk["median_ms"] * 1000 / max(1, len(matrix))
+    return timing
+
+
+def bench_render(repeat):
+    detections = [
+        ("Healthy Plant", 0.9, "tomato"),
+        ("Late Blight", 0.91, "tomato"),
+        ("Wheat Rust", 0.9, "wheat"),
+        ("General Plant Disease", 0.75, "banana"),
+    ]
+    results = {}
+    for disease, confidence, crop in detections:
+        timing = time_call(lambda: [render_prediction(disease, confidence, crop) for _ in range(1000)], repeat)
+        results[f"{crop}:{disease}"] = {"per_response_us": timing["median_ms"]}
+    return results
+
+
+def run(samples, repeat=5):
+    # Decoding and features are measured once per size/format/regime
+    return {
+        "decode": bench_decode(samples, repeat),
+        "features": bench_features(samples, repeat),
+        "tiles": bench_tiles(samples, repeat),
+        "classify": bench_classify(samples, repeat),
+        "render": bench_render(repeat),
+    }
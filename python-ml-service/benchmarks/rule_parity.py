@@ -0,0 +1,177 @@
+"""Decision parity between the rule table and the original if/elif chain
+
+Usage:
+    python -m benchmarks.rule_parity [--rows N] [--seed N]
+
+Classifies random feature rows, plus rows sitting on and either side of
+every threshold in the chain, with analysis.classify_batch and with
+legacy_classify_features, for every crop with and without tile features.
+Prints the row count and any differing rows as JSON and exits non-zero if
+there are any. Only meaningful for the shipped rules.json.
+"""
+import argparse
+import itertools
+import json
+import sys
+
+import numpy as np
+
+from analysis import classify_batch
+from benchmarks.bench_features import CROPS
+from catalog import normalize_crop
+
+# Tile thresholds of the chain as they were in analysis.py
+LOCAL_LESION_FRACTION = 0.01
+LOCAL_BROWN_FRACTION = 0.03
+
+# Constants the chain compares channel means and green_std with
+MEAN_THRESHOLDS = (80, 110, 120, 140, 150, 200)
+STD_THRESHOLDS = (45, 60)
+FRACTION_THRESHOLDS = (LOCAL_LESION_FRACTION, LOCAL_BROWN_FRACTION)
+
+
+def legacy_classify_features(red_mean, green_mean, blue_mean, green_std, crop_type, tiles=None):
+    """classify_features exactly as it was before the rule table"""
+    # Disease indicators
+    brown_spots = red_mean > green_mean and red_mean > 120
+    yellow_patches = red_mean > 150 and green_mean > 150 and blue_mean < 100
+    dark_lesions = red_mean < 80 and green_mean < 80 and blue_mean < 80
+    white_growth = red_mean > 200 and green_mean > 200 and blue_mean > 200
+
+    # Texture analysis (simplified)
+    texture_variation = green_std > 60  # High variation indicates disease
+
+    # Lesions confined to a few tiles
+    if tiles is not None:
+        _, dark_tile_fraction, brown_tile_fraction, _ = tiles
+        local_lesions = dark_tile_fraction >= LOCAL_LESION_FRACTION
+        local_brown_spots = brown_tile_fraction >= LOCAL_BROWN_FRACTION
+    else:
+        local_lesions = local_brown_spots = False
+
+    # Disease detection logic
+    crop_type = normalize_crop(crop_type)
+    if crop_type == "potato":
+        if dark_lesions and texture_variation:
+            return "Late Blight", 0.92
+        elif brown_spots:
+            return "Early Blight", 0.88
+        elif white_growth:
+            return "Powdery Mildew", 0.85
+        elif local_lesions:
+            return "Late Blight", 0.80
+        elif local_brown_spots:
+            return "Early Blight", 0.78
+    elif crop_type == "tomato":
+        if dark_lesions and texture_variation:
+            return "Late Blight", 0.91
+        elif brown_spots and texture_variation:
+            return "Early Blight", 0.89
+        elif yellow_patches:
+            return "Bacterial Spot", 0.86
+        elif local_lesions:
+            return "Late Blight", 0.79
+        elif local_brown_spots:
+            return "Early Blight", 0.78
+    elif crop_type == "wheat":
+        if red_mean > 140 and texture_variation:
+            return "Wheat Rust", 0.90
+        elif local_brown_spots:
+            return "Wheat Rust", 0.78
+    elif crop_type == "rice":
+        if brown_spots and texture_variation:
+            return "Blast Disease", 0.88
+        elif local_brown_spots:
+            return "Blast Disease", 0.77
+    elif crop_type == "corn":
+        if brown_spots and texture_variation:
+            return "Corn Leaf Blight", 0.87
+        elif local_brown_spots:
+            return "Corn Leaf Blight", 0.76
+
+    # If no specific disease patterns detected, check if healthy
+    green_dominance = green_mean > (red_mean * 1.15) and green_mean > (blue_mean * 1.1)
+    is_uniform = green_std < 45
+
+    if green_dominance and is_uniform and green_mean > 110:
+        return "Healthy Plant", 0.90
+
+    # Default to most common disease for crop if unclear
+    return "General Plant Disease", 0.75
+
+
+def around(value):
+    """value and its nearest floats on either side"""
+    return (np.nextafter(value, -np.inf), value, np.nextafter(value, np.inf))
+
+
+def random_rows(rows, rng):
+    features = np.column_stack([rng.uniform(0, 255, (rows, 3)), rng.uniform(0, 128, rows)])
+    tiles = np.column_stack([rng.uniform(0, 255, rows), rng.uniform(0, 0.06, (rows, 2)), rng.uniform(0, 128, rows)])
+    return features, tiles
+
+
+def boundary_rows():
+    """Rows on and either side of each threshold, including the scaled green comparisons"""
+    means = sorted({v for t in MEAN_THRESHOLDS for v in around(float(t))} | {30.0, 100.0, 130.0, 170.0, 230.0})
+    stds = sorted({v for t in STD_THRESHOLDS for v in around(float(t))} | {10.0, 50.0, 90.0})
+    fractions = sorted({v for t in FRACTION_THRESHOLDS for v in around(t)} | {0.0, 0.5})
+    features = [list(row) for row in itertools.product(means, means, means, stds)]
+    # green_mean against red_mean * 1.15, blue_mean * 1.1 and red_mean itself
+    for base in (60.0, 100.0, 120.0, 130.0, 200.0):
+        for green in around(base * 1.15) + around(base * 1.1) + around(base):
+            for red, blue in ((base, base), (base, 0.0), (0.0, base), (base + 1, base - 1)):
+                features.extend([red, green, blue, std] for std in stds)
+    features = np.array(features)
+    tiles = np.array([[0.0, dark, brown, 0.0] for dark in fractions for brown in fractions])
+    # Every feature row against every tile row would be large; cycle through the tile rows instead
+    return features, tiles[np.arange(len(features)) % len(tiles)]
+
+
+def mismatches(features, tiles, crops):
+    found = []
+    for crop in crops:
+        crop_column = [crop] * len(features)
+        for row_tiles in (None, tiles):
+            decisions = classify_batch(features, crop_column, row_tiles)
+            for i, decision in enumerate(decisions):
+                expected = legacy_classify_features(
+                    *features[i], crop, None if row_tiles is None else tuple(row_tiles[i])
+                )
+                if decision != expected:
+                    found.append({
+                        "crop": crop,
+                        "features": features[i].tolist(),
+                        "tiles": None if row_tiles is None else row_tiles[i].tolist(),
+                        "rules": decision,
+                        "legacy": expected,
+                    })
+    return found
+
+
+def run(rows, seed):
+    crops = CROPS + ("Tomato ",)
+    random_features, random_tiles = random_rows(rows, np.random.default_rng(seed))
+    edge_features, edge_tiles = boundary_rows()
+    found = mismatches(random_features, random_tiles, crops) + mismatches(edge_features, edge_tiles, crops)
+    return {
+        "random_rows": rows,
+        "boundary_rows": len(edge_features),
+        "crops": list(crops),
+        "mismatches": len(found),
+        "examples": found[:10],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    result = run(args.rows, args.seed)
+    print(json.dumps(result, indent=2))
+    return 1 if result["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
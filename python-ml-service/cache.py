@@ -0,0 +1,274 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from catalog import normalize_crop
+
+CACHE_BACKENDS = ("memory", "sqlite", "off")
+
+# Rough per-entry bookkeeping cost on top of the key and disease name
+ENTRY_OVERHEAD_BYTES = 200
+
+# How often the SQLite cache deletes expired rows; lookups skip them in between
+PURGE_INTERVAL_SECONDS = 30
+
+
+def make_cache_key(image_data, crop, max_pixels=0, tile_rules=False, namespace=""):
+    """Key a decision by image content, normalized crop and the analysis settings
+
+    namespace identifies what produced the decision (see decision_namespace),
+    so cached decisions stop matching once the model or the rules change.
+    """
+    digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+    return f"{namespace}:{digest}:{normalize_crop(crop)}:{max_pixels}{':tiles' if tile_rules else ''}"
+
+
+def decision_namespace(model_version, rules_path):
+    """Model version plus a digest of the rule table, as loaded from rules_path
+
+    The table is hashed in canonical JSON form, so reformatting the file
+    keeps the cache while any change to a rule invalidates it.
+    """
+    with open(rules_path, "rb") as f:
+        spec = json.load(f)
+    canonical = json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return f"{model_version}:{hashlib.blake2b(canonical, digest_size=8).hexdigest()}"
+
+
+def _entry_size(key, value):
+    return len(key) + len(value[0]) + ENTRY_OVERHEAD_BYTES
+
+
+class ResultCache:
+    """Bounded in-process LRU cache of (disease, confidence) decisions with a TTL"""
+
+    # Whether calls do file I/O and so belong off the event loop
+    blocking = False
+
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items):
+        for key, value in items:
+            self.set(key, value)
+
+    def set(self, key, value):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[2]
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteResultCache:
+    """Result cache in a local SQLite file so several uvicorn workers share hits
+
+    Counters are per process; entries, sizes and eviction are shared. The
+    entry count and byte total live in a one-row table kept current by
+    triggers, so eviction and stats() never scan the results table.
+    """
+
+    blocking = True
+
+    def __init__(self, path, max_bytes, ttl_seconds):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " disease TEXT NOT NULL,"
+                " confidence REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS totals ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " entries INTEGER NOT NULL,"
+                " bytes INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN"
+                " UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN"
+                " UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+            # Files written before the totals table get it filled once from the rows already there
+            self._db.execute(
+                "INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        values = []
+        with self._lock:
+            for key in keys:
+                row = self._db.execute(
+                    "SELECT disease, confidence, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    values.append(None)
+                    continue
+
+                disease, confidence, expires_at = row
+                if expires_at <= now:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self.expirations += 1
+                    self.misses += 1
+                    values.append(None)
+                    continue
+
+                self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                values.append((disease, confidence))
+        return values
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Store several decisions in one transaction"""
+        now = time.time()
+        rows = []
+        for key, (disease, confidence) in items:
+            size = _entry_size(key, (disease, confidence))
+            if size <= self.max_bytes:
+                rows.append((key, disease, confidence, size, now + self.ttl_seconds, now))
+        if not rows:
+            return
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    # Delete then insert, rather than INSERT OR REPLACE, so the delete trigger sees the old row
+                    self._db.execute("DELETE FROM results WHERE key = ?", (row[0],))
+                    self._db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)", row)
+                if now >= self._next_purge:
+                    self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                    self._next_purge = now + min(PURGE_INTERVAL_SECONDS, self.ttl_seconds)
+                self._evict_locked()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict_locked(self):
+        (total,) = self._db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()
+        while total > self.max_bytes:
+            oldest = self._db.execute("SELECT key, size FROM results ORDER BY last_access LIMIT 64").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._db.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def create_result_cache(backend, max_bytes, ttl_seconds, path=None):
+    """Build the configured result cache, or None when caching is off"""
+    if backend == "memory":
+        return ResultCache(max_bytes, ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteResultCache(path, max_bytes, ttl_seconds)
+    if backend == "off":
+        return None
+    raise ValueError(f"Unknown cache backend {backend!r}, expected one of {CACHE_BACKENDS}")
@@ -0,0 +1,208 @@
+import json
+import mmap
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+import config
+
+
+def dumps(obj):
+    """Encode obj as compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """Decode JSON from bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def utc_timestamp(seconds=None):
+    """ISO 8601 UTC time for an epoch timestamp, or for now"""
+    moment = datetime.now(timezone.utc) if seconds is None else datetime.fromtimestamp(seconds, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def normalize_crop(crop):
+    """Canonical crop name used by the rules, cache keys and catalog lookups"""
+    return crop.strip().lower()
+
+
+def load_catalog(path):
+    """Parse the catalog file straight from a read-only memory map"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # orjson parses the mapped pages in place; json needs a bytes copy
+        return loads(memoryview(data)) if orjson is not None else json.loads(data[:])
+
+
+_CATALOG = load_catalog(config.CATALOG_PATH)
+
+# Comprehensive disease database with accurate treatments
+DISEASE_DATABASE = _CATALOG["diseases"]
+
+# Used for crops that are not in DISEASE_DATABASE
+DEFAULT_DISEASES = _CATALOG["default_diseases"]
+
+# Shown when the analysis finds no disease; {crop} is filled in per request
+HEALTHY_PLANT = _CATALOG["healthy"]
+
+# Returned when a prediction fails
+FALLBACK_DIAGNOSIS = _CATALOG["fallback"]
+
+MODEL_VERSION = _CATALOG["model_version"]
+
+
+def freeze(value):
+    """Deep read-only copy: dicts become mapping proxies and lists tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ResponseTemplate:
+    """A JSON object encoded once, with the per-request fields appended on render"""
+
+    def __init__(self, static_fields):
+        body = dumps(static_fields)
+        # Drop the closing brace so per-request fields can be appended
+        self._prefix = body[:-1] + b"," if static_fields else b"{"
+
+    def render(self, **fields):
+        if not fields:
+            return self._prefix[:-1] + b"}"
+        return self._prefix + dumps(fields)[1:]
+
+
+# Crop key used in the index for crops missing from DISEASE_DATABASE
+UNKNOWN_CROP = "*"
+
+# Key of DEFAULT_DISEASES in the catalog documents and compact responses
+DEFAULT_CATALOG_KEY = "default"
+
+# Fields of a full response kept in a compact one, besides the per-request fields
+COMPACT_FIELDS = ("name", "confidence", "severity", "model_version")
+
+
+def compact_template(static_fields, catalog_crop):
+    """Template for a compact response: the catalog join key plus a few summary fields"""
+    fields = {key: static_fields[key] for key in COMPACT_FIELDS if key in static_fields}
+    fields["catalog_crop"] = catalog_crop
+    return ResponseTemplate(fields)
+
+
+class CatalogEntry:
+    """An immutable disease record together with its pre-encoded responses"""
+
+    __slots__ = ("disease", "template", "compact_template")
+
+    def __init__(self, disease, crop_key=UNKNOWN_CROP):
+        self.disease = freeze(disease)
+        static_fields = {key: value for key, value in disease.items() if key != "confidence"}
+        static_fields["model_version"] = MODEL_VERSION
+        self.template = ResponseTemplate(static_fields)
+        catalog_crop = DEFAULT_CATALOG_KEY if crop_key == UNKNOWN_CROP else crop_key
+        self.compact_template = compact_template(static_fields, catalog_crop)
+
+    def render(self, confidence, crop, compact=False):
+        template = self.compact_template if compact else self.template
+        return template.render(
+            confidence=confidence,
+            analyzed_crop=crop.title(),
+            analysis_timestamp=utc_timestamp(),
+        )
+
+
+def compile_catalog(database, default_diseases):
+    """Build the (crop, disease name) index along with each crop's first entry"""
+    index = {}
+    first_entries = {}
+    for crop, diseases in list(database.items()) + [(UNKNOWN_CROP, default_diseases)]:
+        for disease in diseases:
+            index.setdefault((crop, disease["name"]), CatalogEntry(disease, crop))
+        first_entries[crop] = index[(crop, diseases[0]["name"])]
+    return MappingProxyType(index), MappingProxyType(first_entries)
+
+
+CATALOG_INDEX, FIRST_ENTRIES = compile_catalog(DISEASE_DATABASE, DEFAULT_DISEASES)
+GENERAL_DISEASE_ENTRY = CatalogEntry(DEFAULT_DISEASES[0])
+
+_HEALTHY_DESCRIPTION = HEALTHY_PLANT["description"]
+HEALTHY_TEMPLATE = ResponseTemplate({key: value for key, value in HEALTHY_PLANT.items() if key != "description"})
+FALLBACK_TEMPLATE = ResponseTemplate(FALLBACK_DIAGNOSIS)
+
+# Healthy and fallback diagnoses are not catalog records, so they have no join key
+HEALTHY_COMPACT_TEMPLATE = compact_template(HEALTHY_PLANT, None)
+FALLBACK_COMPACT_TEMPLATE = compact_template(FALLBACK_DIAGNOSIS, None)
+
+
+def lookup_entry(crop_key, detected_disease):
+    """Catalog entry for a detection, mirroring the historical fallbacks
+
+    "General Plant Disease" always maps to the default record; names the crop
+    doesn't list fall back to the crop's first disease, and unknown crops use
+    DEFAULT_DISEASES.
+    """
+    if detected_disease == "General Plant Disease":
+        return GENERAL_DISEASE_ENTRY
+    if crop_key not in DISEASE_DATABASE:
+        crop_key = UNKNOWN_CROP
+    return CATALOG_INDEX.get((crop_key, detected_disease)) or FIRST_ENTRIES[crop_key]
+
+
+def render_prediction(detected_disease, confidence, crop, compact=False):
+    """Encoded JSON body for a detection
+
+    A compact body carries the disease name and the catalog_crop to join it
+    against the /catalog documents instead of the full record.
+    """
+    if detected_disease == "Healthy Plant":
+        if compact:
+            return HEALTHY_COMPACT_TEMPLATE.render(
+                confidence=confidence,
+                analyzed_crop=crop.title(),
+                analysis_timestamp=utc_timestamp(),
+            )
+        return HEALTHY_TEMPLATE.render(
+            confidence=confidence,
+            description=_HEALTHY_DESCRIPTION.format(crop=crop.title()),
+            analyzed_crop=crop.title(),
+            analysis_timestamp=utc_timestamp(),
+        )
+    return lookup_entry(normalize_crop(crop), detected_disease).render(confidence, crop, compact)
+
+
+def render_fallback(crop, compact=False):
+    """Encoded JSON body used when a prediction fails"""
+    template = FALLBACK_COMPACT_TEMPLATE if compact else FALLBACK_TEMPLATE
+    return template.render(analyzed_crop=crop.title(), analysis_timestamp=utc_timestamp())
+
+
+def catalog_record(disease):
+    # The confidence comes with each prediction, not from the catalog
+    return {key: value for key, value in disease.items() if key != "confidence"}
+
+
+def catalog_documents():
+    """Encoded JSON bodies for GET /catalog (key None) and GET /catalog/{crop}
+
+    Per-crop documents are keyed by crop, plus DEFAULT_CATALOG_KEY for the
+    records used by crops the catalog doesn't list.
+    """
+    crops = {crop: [catalog_record(disease) for disease in diseases] for crop, diseases in DISEASE_DATABASE.items()}
+    crops[DEFAULT_CATALOG_KEY] = [catalog_record(disease) for disease in DEFAULT_DISEASES]
+    documents = {
+        crop: dumps({"model_version": MODEL_VERSION, "crop": crop, "diseases": diseases})
+        for crop, diseases in crops.items()
+    }
+    documents[None] = dumps({"model_version": MODEL_VERSION, "crops": crops})
+    return documents
@@ -0,0 +1,72 @@
+import os
+
+# Runtime settings for the ML service, read once from the environment
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Where CPU-bound image analysis runs: "process", "thread" or "inline"
+EXECUTOR_BACKEND = os.getenv("ML_EXECUTOR", "process").lower()
+EXECUTOR_WORKERS = _env_int("ML_WORKERS", os.cpu_count() or 1)
+
+# Pixel budget for decoding; larger uploads are downsampled first (0 = full resolution)
+DECODE_MAX_PIXELS = _env_int("ML_DECODE_MAX_PIXELS", 0)
+
+# Decision cache keyed by image content: "memory", "sqlite" (shared between workers) or "off"
+CACHE_BACKEND = os.getenv("ML_CACHE_BACKEND", "memory").lower()
+CACHE_MAX_BYTES = _env_int("ML_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+CACHE_TTL_SECONDS = _env_int("ML_CACHE_TTL_SECONDS", 3600)
+CACHE_PATH = os.getenv("ML_CACHE_PATH", "result-cache.sqlite3")
+
+# Coalescing of concurrent single-image requests into batched analysis calls
+BATCHING_ENABLED = os.getenv("ML_BATCHING", "on").lower() not in ("0", "off", "false", "no")
+BATCH_WINDOW_MS = _env_float("ML_BATCH_WINDOW_MS", 0.0)
+BATCH_MAX_SIZE = _env_int("ML_BATCH_MAX_SIZE", 32)
+
+# Disease records, treatments and response texts served with each prediction
+CATALOG_PATH = os.getenv("ML_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+
+# How long clients and proxies may reuse the /catalog documents without revalidating
+CATALOG_MAX_AGE_SECONDS = _env_int("ML_CATALOG_MAX_AGE_SECONDS", 3600)
+
+# Crop rule table evaluated over the image features
+RULES_PATH = os.getenv("ML_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+
+# Spatial tile features in the crop rules, so lesions on a small part of the
+# leaf are not averaged away; off keeps the whole-image rules only
+TILE_RULES_ENABLED = os.getenv("ML_TILE_RULES", "off").lower() in ("1", "on", "true", "yes")
+
+# Upload limits enforced while the body streams in, before any full decode
+MAX_UPLOAD_BYTES = _env_int("ML_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_IMAGE_PIXELS = _env_int("ML_MAX_IMAGE_PIXELS", 50_000_000)
+UPLOAD_CHUNK_BYTES = _env_int("ML_UPLOAD_CHUNK_BYTES", 64 * 1024)
+
+# Reuse of decisions for near-duplicate photos (resized or re-encoded copies);
+# off by default since a match is approximate
+PHASH_ENABLED = os.getenv("ML_PHASH_ENABLED", "off").lower() in ("1", "on", "true", "yes")
+PHASH_MAX_DISTANCE = _env_int("ML_PHASH_MAX_DISTANCE", 4)
+PHASH_MAX_COLOR_DELTA = _env_float("ML_PHASH_MAX_COLOR_DELTA", 6.0)
+PHASH_MAX_ENTRIES = _env_int("ML_PHASH_MAX_ENTRIES", 50_000)
+
+# Admission control for the prediction endpoints: requests beyond the
+# concurrency limit wait in a bounded queue, and the rest get 503
+ADMISSION_MAX_CONCURRENCY = _env_int("ML_MAX_CONCURRENCY", EXECUTOR_WORKERS * 8)
+ADMISSION_MAX_QUEUE = _env_int("ML_MAX_QUEUE", 100)
+ADMISSION_MAX_WAIT_MS = _env_float("ML_MAX_QUEUE_WAIT_MS", 5000.0)
+
+# Asynchronous jobs: results kept in "memory" or "sqlite" (survives restarts)
+# for JOB_TTL_SECONDS after they finish
+JOB_STORE_BACKEND = os.getenv("ML_JOB_STORE", "memory").lower()
+JOB_STORE_PATH = os.getenv("ML_JOB_STORE_PATH", "jobs.sqlite3")
+JOB_TTL_SECONDS = _env_int("ML_JOB_TTL_SECONDS", 3600)
+JOB_WORKERS = _env_int("ML_JOB_WORKERS", 2)
+JOB_MAX_PENDING = _env_int("ML_JOB_MAX_PENDING", 100)
+JOB_MAX_WAIT_SECONDS = _env_float("ML_JOB_MAX_WAIT_SECONDS", 60.0)
@@ -0,0 +1,171 @@
+import io
+import threading
+from collections import OrderedDict
+
+from catalog import normalize_crop
+
+# dHash compares neighbouring pixels of a (HASH_SIZE + 1) x HASH_SIZE thumbnail
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Side the decoder is asked to scale down to before the thumbnail is taken
+DRAFT_SIZE = 64
+
+
+class Fingerprint:
+    """Perceptual hash of an image plus the coarse colour it was taken from
+
+    dHash only sees brightness gradients, so two leaves with the same shape but
+    different colours hash alike; the mean colour of the thumbnail tells them apart.
+    """
+
+    __slots__ = ("hash", "color", "is_color")
+
+    def __init__(self, hash, color, is_color):
+        self.hash = hash
+        self.color = color
+        self.is_color = is_color
+
+
+def fingerprint_image(image_data):
+    """Fingerprint for one encoded image, or None if it cannot be decoded"""
+    # Imported here so the service can start without loading the image stack
+    import numpy as np
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        is_color = len(image.getbands()) >= 3
+        # JPEGs are decoded at 1/2 to 1/8 scale straight away
+        image.draft("RGB", (DRAFT_SIZE, DRAFT_SIZE))
+        thumbnail = image.convert("RGB").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    except Exception:
+        return None
+
+    pixels = np.asarray(thumbnail, dtype=np.float64)
+    gray = pixels @ np.array([0.299, 0.587, 0.114])
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    hash_value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    color = tuple(float(v) for v in pixels.reshape(-1, 3).mean(axis=0))
+    return Fingerprint(hash_value, color, is_color)
+
+
+def fingerprint_images(images):
+    """fingerprint_image for a batch; runs on the analysis pool"""
+    return [fingerprint_image(image_data) for image_data in images]
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def band_masks(max_distance):
+    """(shift, mask) for the bands of a multi-index hash table
+
+    Splitting the hash into max_distance + 1 bands guarantees that any hash
+    within max_distance bits matches at least one band exactly.
+    """
+    bands = min(max_distance + 1, HASH_BITS)
+    masks = []
+    start = 0
+    for band in range(bands):
+        width = HASH_BITS // bands + (1 if band < HASH_BITS % bands else 0)
+        masks.append((start, (1 << width) - 1))
+        start += width
+    return masks
+
+
+class NearDuplicateIndex:
+    """Bounded LRU index of decisions keyed by perceptual hash
+
+    Lookups find the closest stored fingerprint for the same crop and decode
+    budget within max_distance bits and max_color_delta per channel, using
+    multi-index hashing: one exact-match table per band of the hash.
+    """
+
+    def __init__(self, max_entries, max_distance, max_color_delta):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_color_delta = max_color_delta
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.unhashable = 0
+        self.evictions = 0
+        self._masks = band_masks(max_distance)
+        self._tables = [{} for _ in self._masks]
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, scope, hash_value):
+        for table, (shift, mask) in zip(self._tables, self._masks):
+            yield table, (scope, (hash_value >> shift) & mask)
+
+    @staticmethod
+    def _scope(crop, max_pixels, fingerprint):
+        return normalize_crop(crop), max_pixels, fingerprint.is_color
+
+    def get(self, fingerprint, crop, max_pixels=0):
+        """Decision stored for the nearest matching image, or None"""
+        with self._lock:
+            self.lookups += 1
+            if fingerprint is None:
+                self.unhashable += 1
+                self.misses += 1
+                return None
+
+            scope = self._scope(crop, max_pixels, fingerprint)
+            best_id = None
+            best_distance = self.max_distance + 1
+            for table, key in self._band_keys(scope, fingerprint.hash):
+                for entry_id in table.get(key, ()):
+                    _, stored, _ = self._entries[entry_id]
+                    distance = hamming_distance(fingerprint.hash, stored.hash)
+                    if distance < best_distance and self._same_color(fingerprint, stored):
+                        best_id, best_distance = entry_id, distance
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def _same_color(self, a, b):
+        return all(abs(x - y) <= self.max_color_delta for x, y in zip(a.color, b.color))
+
+    def add(self, fingerprint, crop, max_pixels, decision):
+        if fingerprint is None or self.max_entries <= 0:
+            return
+
+        scope = self._scope(crop, max_pixels, fingerprint)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, fingerprint, decision)
+            for table, key in self._band_keys(scope, fingerprint.hash):
+                table.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                evicted_id, (evicted_scope, evicted, _) = self._entries.popitem(last=False)
+                for table, key in self._band_keys(evicted_scope, evicted.hash):
+                    bucket = table[key]
+                    bucket.discard(evicted_id)
+                    if not bucket:
+                        del table[key]
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unhashable": self.unhashable,
+            "evictions": self.evictions,
+            "short_circuit_rate": self.hits / self.lookups if self.lookups else 0.0,
+        }
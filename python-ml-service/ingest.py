@@ -0,0 +1,172 @@
+import io
+
+from fastapi import HTTPException
+
+# Leading bytes of the image formats accepted for analysis
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+SNIFF_BYTES = 12
+
+# Give up on finding the header (e.g. a JPEG SOF marker behind EXIF data) after this much
+PROBE_LIMIT_BYTES = 1024 * 1024
+
+
+class UploadRejected(HTTPException):
+    """An upload refused before decoding; reason is a short label for metrics"""
+
+    def __init__(self, status_code, reason, detail):
+        super().__init__(status_code=status_code, detail=detail)
+        self.reason = reason
+
+
+class ImageProbe:
+    """What the image header says, read without decoding any pixels"""
+
+    __slots__ = ("format", "width", "height", "mode")
+
+    def __init__(self, format, width, height, mode):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.mode = mode
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+
+def sniff_format(prefix):
+    """Format name for the leading bytes of an upload, or None if unrecognized"""
+    if prefix[:4] == b"RIFF" and prefix[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, name in SIGNATURES:
+        if prefix.startswith(signature):
+            return name
+    return None
+
+
+def probe_image_header(data, max_pixels, complete):
+    """Check format and dimensions from the first bytes of an upload
+
+    Returns None when more bytes are needed to find the header. Raises
+    UploadRejected for non-images and images above max_pixels.
+    """
+    if len(data) < SNIFF_BYTES and not complete:
+        return None
+    if sniff_format(bytes(data[:SNIFF_BYTES])) is None:
+        raise UploadRejected(415, "not_an_image", "Upload is not a JPEG, PNG, WEBP, GIF, BMP or TIFF image")
+
+    # Imported here so the service can start without loading the image stack
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            probe = ImageProbe(image.format, image.width, image.height, image.mode)
+    except Image.DecompressionBombError:
+        raise UploadRejected(413, "too_many_pixels", "Image dimensions are too large")
+    except Exception:
+        if complete or len(data) >= PROBE_LIMIT_BYTES:
+            raise UploadRejected(415, "unreadable_header", "Could not read the image header")
+        return None
+
+    if max_pixels and probe.pixels > max_pixels:
+        raise UploadRejected(
+            413, "too_many_pixels",
+            f"Image is {probe.width}x{probe.height}; at most {max_pixels} pixels are accepted",
+        )
+    return probe
+
+
+async def read_image_stream(chunks, max_bytes, max_pixels):
+    """Collect an upload from an async iterator of chunks, validating as it arrives
+
+    The header is probed as soon as enough bytes are in, so oversized or
+    non-image uploads are refused before the rest is read. Returns the image
+    bytes and its ImageProbe.
+    """
+    parts = []
+    size = 0
+    probe = None
+    next_probe_at = SNIFF_BYTES
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        parts.append(chunk)
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise UploadRejected(413, "too_many_bytes", f"Upload is larger than {max_bytes} bytes")
+
+        if probe is None and size >= next_probe_at:
+            if len(parts) > 1:
+                parts = [b"".join(parts)]
+            probe = probe_image_header(parts[0], max_pixels, complete=False)
+            # Retry with twice as much data, so probing stays linear in the header size
+            next_probe_at = size * 2
+
+    data = b"".join(parts)
+    if probe is None and data:
+        probe = probe_image_header(data, max_pixels, complete=True)
+    return data, probe
+
+
+async def iter_upload_file(file, chunk_size):
+    """A Starlette UploadFile as its first chunk_size bytes, then the rest in one read
+
+    The form parser has already spooled the whole file by the time a handler
+    runs, so smaller reads could not stop the transfer early; they would only
+    add a threadpool hop each. The first chunk is enough for the format and
+    header checks.
+    """
+    head = await file.read(chunk_size)
+    if not head:
+        return
+    yield head
+    rest = await file.read()
+    if rest:
+        yield rest
+
+
+async def iter_bytes(data):
+    yield data
+
+
+class RequestBodyLimit:
+    """ASGI middleware refusing request bodies past a per-path byte limit as they stream in
+
+    Content-Length can be checked before anything is read, but chunked
+    uploads carry none, and multipart forms are parsed and spooled before a
+    handler sees them. Counting bytes in receive() covers both: the request
+    fails with a 413 UploadRejected as soon as the limit is passed.
+    limit_for_path returns the limit for a path, or None for no limit.
+    """
+
+    def __init__(self, app, limit_for_path):
+        self.app = app
+        self.limit_for_path = limit_for_path
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for_path(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadRejected(413, "too_many_bytes", f"Request body is larger than {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,270 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from catalog import dumps, utc_timestamp
+
+JOB_STORE_BACKENDS = ("memory", "sqlite")
+
+# Lifecycle of a job; the last two are final
+JOB_STATES = ("queued", "running", "done", "failed")
+FINISHED_STATES = ("done", "failed")
+
+# Unfinished jobs in a shared store whose owner hasn't renewed them for this
+# long are taken to be orphaned; owners renew on every sweep
+JOB_LEASE_SECONDS = 180
+
+# Drawn once per process, so a later process that reuses the pid (as after a
+# container restart) is told apart from this one
+PROCESS_TOKEN = secrets.token_hex(8)
+
+
+def new_job_id():
+    return secrets.token_hex(16)
+
+
+class Job:
+    """One asynchronous diagnosis; result is the rendered JSON body once done"""
+
+    __slots__ = ("id", "status", "count", "created_at", "started_at", "finished_at", "result", "error", "stages")
+
+    def __init__(self, id, count, status="queued", created_at=None, started_at=None, finished_at=None,
+                 result=None, error=None, stages=None):
+        self.id = id
+        self.count = count
+        self.status = status
+        self.created_at = time.time() if created_at is None else created_at
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.result = result
+        self.error = error
+        self.stages = stages or {}
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def timings(self):
+        """Seconds spent queued, running and in total, plus the analysis stages"""
+        now = time.time()
+        started = self.started_at or now
+        finished = self.finished_at or now
+        return {
+            "queued_seconds": started - self.created_at,
+            "run_seconds": finished - started if self.started_at else 0.0,
+            "total_seconds": finished - self.created_at,
+            "stages": self.stages,
+        }
+
+    def render(self):
+        """JSON body for GET /jobs/{id}; the stored result is embedded as is"""
+        body = {
+            "id": self.id,
+            "status": self.status,
+            "count": self.count,
+            "created_at": utc_timestamp(self.created_at),
+            "started_at": utc_timestamp(self.started_at) if self.started_at else None,
+            "finished_at": utc_timestamp(self.finished_at) if self.finished_at else None,
+            "timings": self.timings(),
+            "error": self.error,
+        }
+        head = dumps(body)
+        return b'%s,"result":%s}' % (head[:-1], self.result if self.result is not None else b"null")
+
+
+class MemoryJobStore:
+    """Jobs of this process, dropped ttl_seconds after they finish"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.expired = 0
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job):
+        # Jobs are kept by reference, so updates are already visible
+        pass
+
+    def sweep(self):
+        """Drop finished jobs past their TTL; returns how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at <= cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        self.expired += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            counts = dict.fromkeys(JOB_STATES, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"backend": "memory", "jobs": counts, "expired": self.expired, "ttl_seconds": self.ttl_seconds}
+
+
+def process_alive(pid):
+    """Whether a process with this pid exists on this host"""
+    if os.name != "posix":
+        # No cheap check; the lease alone decides
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteJobStore:
+    """Jobs persisted in a local SQLite file, so results outlive a restart
+
+    Several worker processes can share the file. Each unfinished job records
+    its owner, the pid plus PROCESS_TOKEN, and
+    when the owner last renewed it. Images are only held in the owner's
+    memory, so jobs whose owner has exited or stopped renewing within
+    lease_seconds are marked failed; jobs of live owners are left alone.
+    """
+
+    def __init__(self, path, ttl_seconds, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.expired = 0
+        self.orphaned = 0
+        self.owner = f"{os.getpid()}:{PROCESS_TOKEN}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " result BLOB,"
+            " error TEXT,"
+            " stages TEXT,"
+            " owner TEXT,"
+            " renewed_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("renewed_at", "REAL")):
+            if column not in columns:
+                # Files written before jobs had owners
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        self.fail_orphans()
+
+    def _owner_gone(self, owner):
+        pid, _, _ = (owner or "").partition(":")
+        if not pid.isdigit():
+            return True
+        if int(pid) == os.getpid():
+            # Same pid but another token: an earlier process, e.g. before a container restart
+            return owner != self.owner
+        return not process_alive(int(pid))
+
+    def fail_orphans(self):
+        """Mark failed the unfinished jobs of owners that exited or let their lease lapse"""
+        now = time.time()
+        with self._lock:
+            owners = [row[0] for row in self._db.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN ('queued', 'running')"
+            )]
+            gone = [owner for owner in owners if owner != self.owner and self._owner_gone(owner)]
+            failed = 0
+            for owner in gone:
+                failed += self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'interrupted by a restart', finished_at = ?"
+                    " WHERE status IN ('queued', 'running') AND owner IS ?",
+                    (now, owner),
+                ).rowcount
+            failed += self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'abandoned by its worker', finished_at = ?"
+                " WHERE status IN ('queued', 'running') AND owner != ? AND renewed_at < ?",
+                (now, self.owner, now - self.lease_seconds),
+            ).rowcount
+        self.orphaned += failed
+        return failed
+
+    def renew(self):
+        """Extend the lease on this store's unfinished jobs"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET renewed_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                (time.time(), self.owner),
+            )
+
+    def add(self, job):
+        self.save(job)
+
+    def save(self, job):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.status, job.count, job.created_at, job.started_at, job.finished_at,
+                 job.result, job.error, json.dumps(job.stages), self.owner, time.time()),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, count, status, created_at, started_at, finished_at, result, error, stages"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        *fields, stages = row
+        return Job(*fields, stages=json.loads(stages) if stages else {})
+
+    def sweep(self):
+        self.renew()
+        self.fail_orphans()
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            removed = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at <= ?", (cutoff,)
+            ).rowcount
+        self.expired += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "jobs": counts,
+            "expired": self.expired,
+            "orphaned": self.orphaned,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def create_job_store(backend, ttl_seconds, path=None):
+    """Build the configured job store"""
+    if backend == "memory":
+        return MemoryJobStore(ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteJobStore(path, ttl_seconds)
+    raise ValueError(f"Unknown job store backend {backend!r}, expected one of {JOB_STORE_BACKENDS}")
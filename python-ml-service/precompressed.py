@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Content codings in order of preference when the client accepts several
+CODINGS = ("br", "gzip", "identity")
+
+# Bodies below this size are only served uncompressed
+MIN_COMPRESS_BYTES = 256
+
+
+def compress(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=11)
+    # mtime=0 keeps the gzip output, and so its ETag, the same across restarts
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def accepted_codings(accept_encoding):
+    """Content codings an Accept-Encoding header allows, with a q-value above zero"""
+    accepted = {"identity"}
+    wildcard = False
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding == "*":
+            wildcard = quality > 0
+        elif quality > 0:
+            accepted.add(coding)
+        else:
+            accepted.discard(coding)
+    if wildcard:
+        accepted.update(CODINGS)
+    return accepted
+
+
+def entity_tags(if_none_match):
+    """Opaque tags listed in an If-None-Match header, weak prefixes dropped"""
+    tags = set()
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.add(tag)
+    return tags
+
+
+class PrecompressedBody:
+    """A static response body encoded once in each content coding, each with a strong ETag
+
+    Compressed variants that would not be smaller than the body itself are
+    left out. Brotli is only offered when the brotli package is installed.
+    """
+
+    def __init__(self, body, media_type="application/json", max_age=0):
+        self.media_type = media_type
+        self.max_age = max_age
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {"identity": (body, f'"{digest}"')}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            for coding in CODINGS:
+                if coding == "identity" or (coding == "br" and brotli is None):
+                    continue
+                data = compress(body, coding)
+                if len(data) < len(body):
+                    self.variants[coding] = (data, f'"{digest}-{coding}"')
+
+    def select(self, accept_encoding):
+        """Coding to send for an Accept-Encoding header"""
+        accepted = accepted_codings(accept_encoding)
+        for coding in CODINGS:
+            if coding in self.variants and coding in accepted:
+                return coding
+        return "identity"
+
+    def matching_tag(self, if_none_match):
+        """ETag of any variant named by If-None-Match, or None
+
+        All variants carry the same content, so a client holding any of them
+        may keep using it.
+        """
+        tags = entity_tags(if_none_match)
+        for _, etag in self.variants.values():
+            if etag in tags or "*" in tags:
+                return etag
+        return None
+
+    def response(self, request):
+        """(Response, coding) for a GET; coding is "not_modified" for a 304"""
+        headers = {"Vary": "Accept-Encoding", "Cache-Control": f"public, max-age={self.max_age}"}
+        etag = self.matching_tag(request.headers.get("if-none-match", ""))
+        if etag is not None:
+            headers["ETag"] = etag
+            return Response(status_code=304, headers=headers), "not_modified"
+
+        coding = self.select(request.headers.get("accept-encoding", ""))
+        body, headers["ETag"] = self.variants[coding]
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(content=body, media_type=self.media_type, headers=headers), coding
+
+    def stats(self):
+        """Size in bytes of each stored variant, by coding"""
+        return {coding: len(body) for coding, (body, _) in self.variants.items()}
@@ -0,0 +1,337 @@
+"""Re-score an archive of scan images offline
+
+Usage:
+    python rescore.py SOURCE --output results.jsonl [--crop-map crops.csv]
+                      [--crop CROP] [--format jsonl|csv] [--workers N]
+                      [--chunk-size N] [--max-pixels N] [--[no-]tile-rules]
+                      [--resume]
+
+SOURCE is a directory or a tar/zip archive of images. The crop of each image
+comes from --crop-map (a CSV with image and crop_name or crop columns, or a
+JSON object of image -> crop), then --crop, then the folder it sits in (e.g.
+scans/tomato/1.jpg). Images are keyed by their path inside SOURCE, and
+mapping entries also match on the file name with or without its extension,
+so a ScanRecord export keyed by id works as is.
+
+Images are analyzed in chunks on a process pool and each result row is
+written as soon as its chunk finishes. The output file is the checkpoint:
+with --resume, images already in it are skipped and a partly written last
+row is dropped. A throughput summary is printed as JSON at the end.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import config
+from analysis import analyze_images_for_disease
+from catalog import MODEL_VERSION, normalize_crop
+from ingest import UploadRejected, probe_image_header
+from workers import create_executor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+OUTPUT_FIELDS = ("image", "crop", "disease", "confidence", "error", "model_version")
+
+# Chunks queued per worker; bounds how many image bytes are held in memory
+CHUNKS_PER_WORKER = 2
+
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 10.0
+
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def member_name(name):
+    """Archive member path without the leading "./" that tar adds for `tar -C dir .`"""
+    return name[2:] if name.startswith("./") else name
+
+
+def source_kind(source):
+    """"dir", "zip" or "tar"; raises ValueError for anything else"""
+    if os.path.isdir(source):
+        return "dir"
+    if os.path.isfile(source):
+        if zipfile.is_zipfile(source):
+            return "zip"
+        if tarfile.is_tarfile(source):
+            return "tar"
+    raise ValueError(f"{source} is not a directory, tar or zip archive")
+
+
+def iter_source(source):
+    """(name, bytes) for every image in a directory, tar or zip archive, in a stable order"""
+    kind = source_kind(source)
+    if kind == "dir":
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if is_image_name(filename):
+                    path = os.path.join(dirpath, filename)
+                    with open(path, "rb") as f:
+                        yield os.path.relpath(path, source).replace(os.sep, "/"), f.read()
+    elif kind == "zip":
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield member_name(info.filename), archive.read(info)
+    else:
+        # Streaming mode reads compressed archives front to back only once
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and is_image_name(member.name):
+                    yield member_name(member.name), archive.extractfile(member).read()
+
+
+def load_crop_map(path):
+    """Image name -> crop from a CSV (image, crop_name or crop columns) or a JSON object"""
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            return {str(key): value for key, value in json.load(f).items()}
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        crop_column = "crop_name" if "crop_name" in (reader.fieldnames or ()) else "crop"
+        return {row["image"]: row[crop_column] for row in reader if row.get("image") and row.get(crop_column)}
+
+
+def resolve_crop(name, crop_map, default_crop):
+    """Crop for an archive member: mapping, then the default, then the parent folder"""
+    filename = name.rsplit("/", 1)[-1]
+    for key in (name, filename, os.path.splitext(filename)[0]):
+        if key in crop_map:
+            return crop_map[key]
+    if default_crop:
+        return default_crop
+    folder = name.rsplit("/", 2)[-2] if "/" in name else ""
+    return folder or None
+
+
+def score_chunk(names, images, crops, max_pixels, tile_rules=False):
+    """Result rows for one chunk of images; runs in a pool worker"""
+    rows = [None] * len(names)
+    pending = []
+
+    for i, (name, image_data, crop) in enumerate(zip(names, images, crops)):
+        row = {"image": name, "crop": crop, "disease": None, "confidence": None, "error": None,
+               "model_version": MODEL_VERSION}
+        rows[i] = row
+        try:
+            # Unreadable files would otherwise come back as the decode fallback
+            probe_image_header(image_data, 0, complete=True)
+        except UploadRejected as e:
+            row["error"] = e.reason
+            continue
+        pending.append(i)
+
+    detections = analyze_images_for_disease(
+        [images[i] for i in pending], [normalize_crop(crops[i]) for i in pending], max_pixels,
+        tile_rules=tile_rules,
+    )
+    for i, (disease, confidence) in zip(pending, detections):
+        rows[i]["disease"] = disease
+        rows[i]["confidence"] = confidence
+    return rows
+
+
+def iter_chunks(samples, chunk_size):
+    """Group (name, bytes, crop) samples into chunks of at most chunk_size images"""
+    chunk = []
+    for sample in samples:
+        chunk.append(sample)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_completed(path, output_format):
+    """Images already written to an earlier output file; drops a partly written last row
+
+    Rows of images that had no crop are removed from the file, so they get
+    another go with an updated mapping without leaving duplicates behind.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    text = data[:end].decode("utf-8")
+
+    if output_format == "csv":
+        rows = list(csv.DictReader(text.splitlines()))
+    else:
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    kept = [row for row in rows if row["error"] != "no_crop"]
+    if len(kept) < len(rows):
+        rewrite_rows(path, output_format, kept)
+    return {row["image"] for row in kept}
+
+
+def rewrite_rows(path, output_format, rows):
+    """Replace the output file with rows, atomically"""
+    partial = path + ".tmp"
+    with open(partial, "w", newline="", encoding="utf-8") as f:
+        if output_format == "csv":
+            writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+
+class ResultWriter:
+    """Appends result rows as JSON lines or CSV, flushing after every chunk"""
+
+    def __init__(self, path, output_format):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.output_format = output_format
+        if output_format == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.output_format == "csv":
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def rescore(source, output, output_format, crop_map, default_crop, workers, chunk_size, max_pixels, resume,
+            tile_rules=False):
+    """Score every image in source into output; returns the throughput summary"""
+    source_kind(source)
+    completed = read_completed(output, output_format) if resume else set()
+    if not resume and os.path.exists(output):
+        os.remove(output)
+
+    writer = ResultWriter(output, output_format)
+    # A single worker runs inline so small jobs don't pay for pool start-up
+    executor = create_executor("process" if workers > 1 else "inline", workers)
+    started = time.perf_counter()
+    last_progress = started
+    counts = Counter()
+    diseases = Counter()
+    input_bytes = 0
+
+    def samples():
+        nonlocal input_bytes
+        for name, image_data in iter_source(source):
+            if name in completed:
+                counts["skipped"] += 1
+                continue
+            crop = resolve_crop(name, crop_map, default_crop)
+            if crop is None:
+                counts["unmapped"] += 1
+                writer.write([{"image": name, "crop": None, "disease": None, "confidence": None,
+                               "error": "no_crop", "model_version": MODEL_VERSION}])
+                continue
+            input_bytes += len(image_data)
+            yield name, image_data, crop
+
+    def record(rows):
+        nonlocal last_progress
+        writer.write(rows)
+        for row in rows:
+            counts["scored" if row["error"] is None else "errors"] += 1
+            if row["disease"]:
+                diseases[row["disease"]] += 1
+        now = time.perf_counter()
+        if now - last_progress >= PROGRESS_INTERVAL:
+            last_progress = now
+            print(f"{counts['scored'] + counts['errors']} images, {counts['scored'] / (now - started):.1f}/s",
+                  file=sys.stderr)
+
+    try:
+        in_flight = set()
+        for chunk in iter_chunks(samples(), chunk_size):
+            names, images, crops = (list(column) for column in zip(*chunk))
+            if executor is None:
+                record(score_chunk(names, images, crops, max_pixels, tile_rules))
+                continue
+
+            in_flight.add(executor.submit(score_chunk, names, images, crops, max_pixels, tile_rules))
+            if len(in_flight) >= workers * CHUNKS_PER_WORKER:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future.result())
+
+        for future in wait(in_flight).done:
+            record(future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    processed = counts["scored"] + counts["errors"]
+    return {
+        "source": source,
+        "output": output,
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "scored": counts["scored"],
+        "errors": counts["errors"],
+        "unmapped": counts["unmapped"],
+        "skipped": counts["skipped"],
+        "seconds": elapsed,
+        "images_per_second": processed / elapsed if elapsed else None,
+        "megabytes_per_second": input_bytes / 1e6 / elapsed if elapsed else None,
+        "diseases": dict(diseases.most_common()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        help="output format (default: from the output file extension, else jsonl)")
+    parser.add_argument("--crop-map", help="CSV or JSON file mapping image names to crops")
+    parser.add_argument("--crop", help="crop for images missing from the mapping")
+    parser.add_argument("--workers", type=int, default=config.EXECUTOR_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=32, help="images sent to a worker at a time")
+    parser.add_argument("--max-pixels", type=int, default=config.DECODE_MAX_PIXELS)
+    parser.add_argument("--tile-rules", action=argparse.BooleanOptionalAction, default=config.TILE_RULES_ENABLED,
+                        help="use the spatial tile features in the crop rules (default: ML_TILE_RULES)")
+    parser.add_argument("--resume", action="store_true", help="skip images already in the output file")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    crop_map = load_crop_map(args.crop_map) if args.crop_map else {}
+
+    try:
+        summary = rescore(args.source, args.output, output_format, crop_map, args.crop,
+                          max(1, args.workers), max(1, args.chunk_size), args.max_pixels, args.resume, args.tile_rules)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
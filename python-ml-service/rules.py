@@ -0,0 +1,114 @@
+import json
+import operator
+
+import numpy as np
+
+# Comparison operators allowed in rule conditions
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+# Rule crop that matches every crop
+ANY_CROP = "*"
+
+
+class Comparison:
+    """One term of a condition: column op constant, or column op other_column * scale"""
+
+    __slots__ = ("column", "compare", "other", "value")
+
+    def __init__(self, term, columns):
+        if len(term) not in (3, 4):
+            raise ValueError(f"Rule term {term!r} should be [feature, op, value] or [feature, op, feature, scale]")
+        feature, op, rhs = term[:3]
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r} in rule term {term!r}, expected one of {sorted(OPERATORS)}")
+
+        self.column = _column(feature, columns)
+        self.compare = OPERATORS[op]
+        if isinstance(rhs, str):
+            self.other = _column(rhs, columns)
+            self.value = float(term[3]) if len(term) == 4 else 1.0
+        else:
+            self.other = None
+            self.value = float(rhs)
+
+    def evaluate(self, features):
+        lhs = features[:, self.column]
+        if self.other is None:
+            return self.compare(lhs, self.value)
+        return self.compare(lhs, features[:, self.other] * self.value)
+
+
+def _column(feature, columns):
+    try:
+        return columns.index(feature)
+    except ValueError:
+        raise ValueError(f"Unknown feature {feature!r} in rule table, expected one of {columns}") from None
+
+
+class Rule:
+    __slots__ = ("crop", "when", "disease", "confidence", "group")
+
+    def __init__(self, spec, conditions):
+        self.crop = spec.get("crop", ANY_CROP)
+        self.when = tuple(spec["when"])
+        self.disease = spec["disease"]
+        self.confidence = float(spec["confidence"])
+        self.group = spec.get("group")
+        for name in self.when:
+            if name not in conditions:
+                raise ValueError(f"Rule for {self.crop}/{self.disease} uses unknown condition {name!r}")
+
+
+class RuleTable:
+    """Ordered crop rules evaluated as boolean masks over a feature matrix
+
+    Each rule is a crop (or "*"), a list of named conditions that must all
+    hold, a disease and a confidence. An image gets the first rule that
+    matches it in table order, or the default. Rules tagged with a group only
+    take part when that group is enabled.
+    """
+
+    def __init__(self, spec, columns):
+        self.columns = list(columns)
+        self.conditions = {
+            name: [Comparison(term, self.columns) for term in terms]
+            for name, terms in spec["conditions"].items()
+        }
+        self.rules = [Rule(rule, self.conditions) for rule in spec["rules"]]
+        self.default = (spec["default"]["disease"], float(spec["default"]["confidence"]))
+
+    def classify(self, features, crops, groups=()):
+        """(disease, confidence) for every row of features; crops must be normalized"""
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(self.columns))
+        crops = np.asarray(crops, dtype=object)
+        rules = [rule for rule in self.rules if rule.group is None or rule.group in groups]
+
+        masks = {}
+        for name in {name for rule in rules for name in rule.when}:
+            mask = np.ones(len(features), dtype=bool)
+            for comparison in self.conditions[name]:
+                mask &= comparison.evaluate(features)
+            masks[name] = mask
+
+        crop_masks = {}
+        chosen = np.full(len(features), -1)
+        pending = np.ones(len(features), dtype=bool)
+        for index, rule in enumerate(rules):
+            if rule.crop == ANY_CROP:
+                matched = pending.copy()
+            else:
+                if rule.crop not in crop_masks:
+                    crop_masks[rule.crop] = crops == rule.crop
+                matched = pending & crop_masks[rule.crop]
+            for name in rule.when:
+                matched &= masks[name]
+            chosen[matched] = index
+            pending &= ~matched
+
+        return [self.default if index < 0 else (rules[index].disease, rules[index].confidence) for index in chosen]
+
+
+def load_rule_table(path, columns):
+    """Read and validate a rule table from a JSON file"""
+    with open(path) as f:
+        return RuleTable(json.load(f), columns)
@@ -0,0 +1,51 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+EXECUTOR_BACKENDS = ("process", "thread", "inline")
+
+
+class PoolUnavailable(Exception):
+    """The analysis pool has not come up; analysis is refused rather than run inline"""
+
+
+def _noop():
+    return None
+
+
+def create_executor(backend, workers, initializer=None):
+    """Create the pool that runs image analysis off the event loop
+
+    "inline" returns None and keeps the analysis on the calling thread,
+    which is only meant for debugging. initializer runs once in every
+    worker as it starts.
+    """
+    if backend == "process":
+        # spawn avoids forking a process that already runs an event loop
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=initializer
+        )
+        # Warm the pool up so the first requests don't pay for process start-up
+        try:
+            for future in [executor.submit(_noop) for _ in range(workers)]:
+                future.result()
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor
+    if backend == "thread":
+        # NumPy reductions and PIL decoders release the GIL
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis", initializer=initializer)
+    if backend == "inline":
+        if initializer is not None:
+            initializer()
+        return None
+    raise ValueError(f"Unknown executor backend {backend!r}, expected one of {EXECUTOR_BACKENDS}")
+
+
+async def run_in_executor(executor, func, *args):
+    """Run func(*args) on the executor and await its result"""
+    if executor is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
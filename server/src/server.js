@@ -57,6 +57,7 @@ app.use('/api/farmer-investor', farmerInvestorRoutes);
 
 // ================= PYTHON ML CONFIG =================
 const PYTHON_ML_URL = process.env.PYTHON_ML_URL || 'http://localhost:8001';
+const ML_TIMEOUT_MS = 30000;
 
 // ================= ML DIAGNOSIS API =================
 // Temporarily removed auth for development/testing
@@ -114,9 +115,11 @@ app.post('/api/ml/predict', async (req, res) => {
       {
         headers: {
           ...formData.getHeaders(),
-          'Accept': 'application/json'
+          'Accept': 'application/json',
+          // Lets the ML service drop the request if it can't answer in time
+          'X-Request-Timeout-Ms': String(ML_TIMEOUT_MS)
         },
-        timeout: 30000,
+        timeout: ML_TIMEOUT_MS,
         maxContentLength: Infinity,
         maxBodyLength: Infinity
       }
@@ -166,6 +169,12 @@ app.post('/api/ml/predict', async (req, res) => {
       response: error.response?.data
     });
 
+    // Pass on the ML service's hint for when to retry after shedding load
+    const retryAfter = error.response?.headers?.['retry-after'];
+    if (retryAfter) {
+      res.set('Retry-After', retryAfter);
+    }
+
     // Return error - no fallback data since we want ML service to be the sole source
     res.status(503).json({
       success: false,